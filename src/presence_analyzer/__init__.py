@@ -3,4 +3,4 @@
 Presence analyzer.
 """
 from .main import app
-from . import views
+from . import compression, views
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Presence analyzer benchmarks.
+
+Every module can be run on its own, e.g.:
+    bin/python-console -m presence_analyzer.benchmarks.parsers
+"""
+import timeit
+
+
+def best_of(function, number=1, repeat=3):
+    """
+    Returns the best time in seconds of ``number`` calls of ``function``.
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat))
+
+
+def report(name, seconds, baseline=None):
+    """
+    Prints single benchmark result, optionally with speedup over baseline.
+    """
+    line = '{:<40} {:>12.6f} s'.format(name, seconds)
+    if baseline:
+        line += '  {:>8.2f}x'.format(baseline / seconds)
+    print line
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Compares pure Python and NumPy weekday aggregation engines.
+"""
+import os
+import shutil
+import tempfile
+
+from presence_analyzer import engine
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv
+from presence_analyzer.main import app
+from presence_analyzer.utils import get_data
+
+USERS = 200
+DAYS = 1250
+NUMBER = 10
+
+
+def main():
+    """
+    Runs engine benchmarks per user and across all users.
+    """
+    if engine.numpy is None:
+        print 'numpy is not installed'
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'data.csv')
+        write_csv(path, USERS, DAYS)
+        app.config['DATA_CSV'] = path
+        data = get_data()
+        user = data[0]
+        print '{} users, {} entries per user'.format(USERS, DAYS)
+
+        for name, function in [
+                ('one user', lambda: engine.user_weekday_stats(user)),
+                ('all users', lambda: engine.users_weekday_stats(data)),
+        ]:
+            app.config['AGGREGATION_ENGINE'] = 'python'
+            baseline = best_of(function, NUMBER)
+            report('python, ' + name, baseline / NUMBER)
+            app.config['AGGREGATION_ENGINE'] = 'numpy'
+            report(
+                'numpy, ' + name, best_of(function, NUMBER) / NUMBER, baseline
+            )
+    finally:
+        app.config['AGGREGATION_ENGINE'] = 'python'
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
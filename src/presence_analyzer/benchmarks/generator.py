@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic presence CSV and users XML.
+
+Same arguments and seed always give the same files, so benchmark runs
+on different machines or revisions measure the same input. Files can be
+written from command line, e.g.:
+    bin/python-console -m presence_analyzer.benchmarks.generator \\
+        runtime/bench --scale large
+"""
+import argparse
+import csv
+from datetime import date, timedelta
+import os
+import random
+
+# name -> (users, days)
+SCALES = {
+    'tiny': (20, 365),
+    'small': (100, 5 * 365),
+    'medium': (1000, 5 * 365),
+    'large': (10000, 10 * 365),
+}
+FIRST_DAY = date(2005, 1, 1)
+
+
+def write_csv(path, users, days, seed=0):
+    """
+    Writes synthetic presence CSV with ``users * days`` rows.
+    """
+    rand = random.Random(seed)
+    with open(path, 'w') as csvfile:
+        writer = csv.writer(csvfile)
+        for user_id in xrange(users):
+            for day in xrange(days):
+                start = rand.randint(6 * 3600, 11 * 3600)
+                end = start + rand.randint(3600, 10 * 3600)
+                writer.writerow([
+                    user_id,
+                    FIRST_DAY + timedelta(days=day),
+                    '{:02}:{:02}:{:02}'.format(
+                        start // 3600, start // 60 % 60, start % 60
+                    ),
+                    '{:02}:{:02}:{:02}'.format(
+                        end // 3600, end // 60 % 60, end % 60
+                    ),
+                ])
+
+
+def write_xml(path, users):
+    """
+    Writes intranet users XML with ``users`` users.
+    """
+    with open(path, 'w') as xmlfile:
+        xmlfile.write(
+            '<?xml version="1.0" encoding="UTF-8" ?>\n<intranet>\n'
+            '<server><host>intranet.stxnext.pl</host></server>\n<users>\n'
+        )
+        for user_id in xrange(users):
+            xmlfile.write(
+                '<user id="{0}"><avatar>/api/images/users/{0}</avatar>'
+                '<name>User {0}.</name></user>\n'.format(user_id)
+            )
+        xmlfile.write('</users>\n</intranet>\n')
+
+
+def generate(directory, users, days, seed=0):
+    """
+    Writes data.csv and users.xml into directory.
+
+    Returns paths of both files.
+    """
+    csv_path = os.path.join(directory, 'data.csv')
+    xml_path = os.path.join(directory, 'users.xml')
+    write_csv(csv_path, users, days, seed)
+    write_xml(xml_path, users)
+    return csv_path, xml_path
+
+
+def parse_scale(args):
+    """
+    Returns (users, days) from --scale, --users and --days arguments.
+    """
+    users, days = SCALES[args.scale]
+    return args.users or users, args.days or days
+
+
+def add_scale_arguments(parser):
+    """
+    Adds arguments choosing size of generated data.
+    """
+    parser.add_argument(
+        '--scale', choices=sorted(SCALES), default='small',
+        help='predefined number of users and days',
+    )
+    parser.add_argument('--users', type=int, help='overrides --scale')
+    parser.add_argument('--days', type=int, help='overrides --scale')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    """
+    Writes synthetic files into given directory.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('directory')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    users, days = parse_scale(args)
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    for path in generate(args.directory, users, days, args.seed):
+        print 'Written', path
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how parsing presence CSV scales with number of processes.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv
+from presence_analyzer.benchmarks.store import DAYS, USERS
+from presence_analyzer.utils import read_data
+
+WORKERS = (1, 2, 4, 8)
+
+
+def main():
+    """
+    Runs parallel parsing benchmark on 1M-row synthetic file.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'data.csv')
+        write_csv(path, USERS, DAYS)
+        print 'Loading {} rows, {} CPUs'.format(
+            USERS * DAYS, multiprocessing.cpu_count()
+        )
+        baseline = None
+        for workers in WORKERS:
+            seconds = best_of(lambda: read_data(path, workers), repeat=1)
+            report('{} workers'.format(workers), seconds, baseline)
+            baseline = baseline or seconds
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
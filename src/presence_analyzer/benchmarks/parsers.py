@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Compares fast-path date/time parsers with datetime.strptime.
+"""
+from datetime import datetime
+
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.utils import parse_date, parse_time
+
+NUMBER = 100000
+DATE_VALUE = '2013-09-10'
+TIME_VALUE = '09:39:05'
+
+
+def strptime_row():
+    """
+    Parses one row the way get_data used to.
+    """
+    datetime.strptime(DATE_VALUE, '%Y-%m-%d').date()
+    datetime.strptime(TIME_VALUE, '%H:%M:%S').time()
+    datetime.strptime(TIME_VALUE, '%H:%M:%S').time()
+
+
+def fast_path_row():
+    """
+    Parses one row with fast-path parsers.
+    """
+    parse_date(DATE_VALUE)
+    parse_time(TIME_VALUE)
+    parse_time(TIME_VALUE)
+
+
+def main():
+    """
+    Runs parser benchmarks.
+    """
+    print 'Parsing {} rows'.format(NUMBER)
+    baseline = best_of(strptime_row, NUMBER)
+    report('datetime.strptime', baseline)
+    report('parse_date/parse_time', best_of(fast_path_row, NUMBER), baseline)
+
+
+if __name__ == '__main__':
+    main()
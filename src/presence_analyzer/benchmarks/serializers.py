@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Compares JSON serializers on the largest API responses.
+"""
+import os
+import shutil
+import tempfile
+
+from presence_analyzer import serializers
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv
+from presence_analyzer.main import app
+from presence_analyzer.utils import get_data
+from presence_analyzer.views import METRICS
+
+USERS = 10000
+DAYS = 20
+NUMBER = 10
+
+
+def responses(data):
+    """
+    Returns (name, value) pairs of all-users listing and bulk response.
+    """
+    users = [
+        {'user_id': i, 'name': 'User {}'.format(i)} for i in data.keys()
+    ]
+    bulk = []
+    for user_id, stats in data.weekday_table.iteritems():
+        result = {name: metric(stats) for name, metric in METRICS.items()}
+        result['user_id'] = user_id
+        bulk.append(result)
+    return [('users', users), ('bulk', bulk)]
+
+
+def main():
+    """
+    Runs serializer benchmarks for every installed library.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    old_serializer = app.config['JSON_SERIALIZER']
+    try:
+        app.config['DATA_CSV'] = os.path.join(tmp_dir, 'data.csv')
+        write_csv(app.config['DATA_CSV'], USERS, DAYS)
+        print '{} users, installed: {}'.format(
+            USERS, ', '.join(serializers.SERIALIZERS)
+        )
+        for name, value in responses(get_data()):
+            baseline = None
+            for serializer in sorted(
+                    serializers.SERIALIZERS, key=lambda item: item != 'json'
+            ):
+                app.config['JSON_SERIALIZER'] = serializer
+                seconds = best_of(
+                    lambda: serializers.dumps(value), NUMBER
+                ) / NUMBER
+                report('{}, {}'.format(name, serializer), seconds, baseline)
+                baseline = baseline or seconds
+    finally:
+        app.config['JSON_SERIALIZER'] = old_serializer
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
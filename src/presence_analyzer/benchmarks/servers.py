@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Measures API throughput of WSGI servers under concurrent polling clients.
+
+Compares Paste threadpool server, used by deploy.ini, with werkzeug
+threaded server, with and without background refresh of source files,
+while new rows are appended to presence CSV. Clients request the mix of
+``bin/flask-ctl loadtest``, e.g.:
+    bin/python-console -m presence_analyzer.benchmarks.servers \\
+        --scale small --clients 32 --duration 10
+"""
+import argparse
+from datetime import timedelta
+import logging
+import shutil
+import tempfile
+import threading
+
+from werkzeug.serving import make_server
+
+from presence_analyzer.benchmarks.generator import (
+    FIRST_DAY,
+    add_scale_arguments,
+    generate,
+    parse_scale,
+)
+from presence_analyzer.loadtest import (
+    Settings,
+    drive,
+    httpserver,
+    serve,
+    summarize,
+)
+from presence_analyzer.main import app
+from presence_analyzer.refresh import start_refresher, stop_refresher
+from presence_analyzer.utils import get_data, get_users, response_cache
+
+
+def werkzeug_server(workers):
+    """
+    Returns werkzeug server spawning thread per request, and its stopper.
+    """
+    # pylint: disable=unused-argument
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    return server, server.shutdown
+
+
+def paste_server(workers):
+    """
+    Returns Paste server with pool of ``workers`` threads, and its stopper.
+    """
+    server = serve(app, Settings(workers, 5, 0))
+
+    def stop():
+        """
+        Stops request loop and thread pool.
+        """
+        server.running = False
+        server.server_close()
+    return server, stop
+
+
+SERVERS = [('werkzeug', werkzeug_server)]
+if httpserver is not None:
+    SERVERS.insert(0, ('paste', paste_server))
+
+
+class Appender(threading.Thread):
+    """
+    Appends a presence row to CSV file every ``interval`` seconds.
+    """
+
+    def __init__(self, path, day, interval):
+        super(Appender, self).__init__(name='csv-appender')
+        self.daemon = True
+        self.path = path
+        self.day = day
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.day += 1
+            with open(self.path, 'a') as csvfile:
+                csvfile.write('0,{},09:00:00,17:00:00\r\n'.format(
+                    FIRST_DAY + timedelta(days=self.day)
+                ))
+
+
+def measure(factory, workers, clients, duration, users):
+    """
+    Serves application with server from ``factory`` and drives it with
+    load test mix of requests.
+
+    Returns loadtest.Result.
+    """
+    server, stop = factory(workers)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        return summarize(None, *drive(
+            'http://127.0.0.1:{}'.format(server.server_port),
+            range(users), clients, duration,
+        ))
+    finally:
+        stop()
+
+
+def main():
+    """
+    Runs servers benchmark as command line script.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    add_scale_arguments(parser)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument(
+        '--workers', type=int, default=10, help='Paste threadpool size',
+    )
+    parser.add_argument('--duration', type=float, default=5, help='seconds')
+    parser.add_argument(
+        '--append', type=float, default=0.5,
+        help='seconds between rows appended to CSV, 0 disables',
+    )
+    args = parser.parse_args()
+    users, days = parse_scale(args)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    tmp_dir = tempfile.mkdtemp()
+    config = dict(app.config)
+    try:
+        csv_path, xml_path = generate(tmp_dir, users, days, args.seed)
+        app.config.update(DATA_CSV=csv_path, USERS_XML=xml_path)
+        print '{} users, {} days, {} clients'.format(
+            users, days, args.clients
+        )
+        for name, factory in SERVERS:
+            for refresh in (0, 1):
+                if refresh:
+                    start_refresher(refresh)
+                appender = Appender(csv_path, days, args.append)
+                if args.append:
+                    appender.start()
+                try:
+                    result = measure(
+                        factory, args.workers, args.clients, args.duration,
+                        users,
+                    )
+                finally:
+                    appender.stopped.set()
+                    stop_refresher()
+                line = '{:<20} {:>8.1f} req/s {:>8.1f} ms p95 {:>6.2f}% errors'
+                print line.format(
+                    name + (', refresh' if refresh else ''),
+                    result.throughput, result.p95 * 1000,
+                    result.error_rate * 100,
+                )
+    finally:
+        app.config.clear()
+        app.config.update(config)
+        get_data.invalidate()
+        get_users.invalidate()
+        response_cache.clear()
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Compares reading presence CSV with reading its binary snapshot.
+"""
+import os
+import shutil
+import tempfile
+
+from presence_analyzer import snapshot
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv
+from presence_analyzer.benchmarks.store import DAYS, USERS
+from presence_analyzer.utils import read_data
+
+
+def main():
+    """
+    Runs snapshot benchmark on 1M-row synthetic file.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'data.csv')
+        write_csv(path, USERS, DAYS)
+        print 'Loading {} rows'.format(USERS * DAYS)
+
+        baseline = best_of(lambda: read_data(path), repeat=1)
+        report('read CSV', baseline)
+        report('save snapshot', best_of(
+            lambda: snapshot.save(read_data(path), path), repeat=1
+        ) - baseline)
+        report('load snapshot', best_of(lambda: snapshot.load(path)), baseline)
+        os.utime(path, None)
+        report(
+            'load snapshot, hash checked',
+            best_of(lambda: snapshot.load(path)),
+            baseline,
+        )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
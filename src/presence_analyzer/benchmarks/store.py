@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Compares memory used by PresenceStore and the old dict-of-dicts structure.
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv
+from presence_analyzer.main import app
+from presence_analyzer.utils import get_data, parse_date, parse_time
+
+USERS = 400
+DAYS = 2500  # USERS * DAYS = 1M rows
+
+
+def load_dicts(path):
+    """
+    Loads CSV into {user_id: {date: {'start': time, 'end': time}}}.
+    """
+    data = {}
+    with open(path) as csvfile:
+        for row in csv.reader(csvfile):
+            data.setdefault(int(row[0]), {})[parse_date(row[1])] = {
+                'start': parse_time(row[2]),
+                'end': parse_time(row[3]),
+            }
+    return data
+
+
+def deep_size(obj):
+    """
+    Returns size in bytes of object and everything it references.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.iterkeys())
+            stack.extend(item.itervalues())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+    return size
+
+
+def main():
+    """
+    Runs memory benchmark on 1M-row synthetic file.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'data.csv')
+        write_csv(path, USERS, DAYS)
+        print 'Loading {} rows'.format(USERS * DAYS)
+
+        dicts_size = deep_size(load_dicts(path))
+        app.config['DATA_CSV'] = path
+        store_size = deep_size(get_data())
+        print '{:<40} {:>12.1f} MB'.format('dict of dicts', dicts_size / 1e6)
+        print '{:<40} {:>12.1f} MB  {:>8.2f}x'.format(
+            'PresenceStore', store_size / 1e6, float(dicts_size) / store_size
+        )
+
+        report('load dict of dicts', best_of(lambda: load_dicts(path)))
+        report('load PresenceStore', best_of(get_data.function))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
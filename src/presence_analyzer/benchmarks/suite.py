@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Runs benchmark suite on generated data and compares it with a baseline.
+
+Results are written as JSON, e.g.:
+    bin/python-console -m presence_analyzer.benchmarks.suite \\
+        --scale medium --output var/bench.json --compare var/base.json
+
+Exits with status 1 when any benchmark is slower than in the baseline by
+more than --threshold.
+"""
+import argparse
+from datetime import datetime
+import json
+import platform
+import shutil
+import sys
+import tempfile
+
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import (
+    add_scale_arguments,
+    generate,
+    parse_scale,
+)
+from presence_analyzer.main import app
+from presence_analyzer.utils import (
+    get_data,
+    get_users,
+    group_by_weekday,
+    group_user_avgs_weekday,
+    response_cache,
+)
+
+# API endpoints measured through test client, {user} is replaced with id
+# of an existing user
+ENDPOINTS = [
+    '/api/v1/users',
+    '/api/v1/users?from=2006-01-01&to=2006-12-31',
+    '/api/v1/mean_time_weekday/{user}',
+    '/api/v1/presence_weekday/{user}',
+    '/api/v1/presence_start_end/{user}',
+    '/api/v1/presence_start_end/{user}?from=2006-01-01&to=2006-12-31',
+    '/api/v1/bulk',
+    '/api/v1/rollup/presence_weekday',
+    '/api/v1/rollup/presence_start_end?users=1,2,3',
+    '/api/v1/top/presence?n=10',
+]
+
+
+def benchmarks(client, user):
+    """
+    Returns list of (name, function) pairs to measure.
+
+    Response cache is cleared before every request, so endpoints are
+    measured computing their responses.
+    """
+    data = get_data()
+
+    def request(url):
+        """
+        Returns function requesting given url.
+        """
+        def function():
+            """
+            Requests url with empty response cache.
+            """
+            response_cache.clear()
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status)
+            return response.data
+        return function
+
+    result = [
+        ('get_data', get_data.function),
+        ('get_users', get_users.function),
+        ('group_by_weekday', lambda: [
+            group_by_weekday(items) for items in data.itervalues()
+        ]),
+        ('group_user_avgs_weekday', lambda: [
+            group_user_avgs_weekday(items) for items in data.itervalues()
+        ]),
+    ]
+    for url in ENDPOINTS:
+        url = url.format(user=user)
+        result.append(('GET ' + url, request(url)))
+    return result
+
+
+def run(users, days, seed=0, repeat=3):
+    """
+    Runs all benchmarks on data of given size.
+
+    Returns dict with best times in seconds by benchmark name.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    config = dict(app.config)
+    try:
+        csv_path, xml_path = generate(tmp_dir, users, days, seed)
+        app.config.update(
+            DATA_CSV=csv_path, USERS_XML=xml_path, DATA_SNAPSHOT=False,
+        )
+        results = {}
+        for name, function in benchmarks(app.test_client(), users // 2):
+            results[name] = best_of(function, repeat=repeat)
+            report(name, results[name])
+        return results
+    finally:
+        app.config.clear()
+        app.config.update(config)
+        get_data.invalidate()
+        get_users.invalidate()
+        shutil.rmtree(tmp_dir)
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints results relative to baseline.
+
+    Returns names of benchmarks slower by more than ``threshold``, e.g.
+    0.2 for 20%.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        slower = ratio > 1 + threshold
+        if slower:
+            regressions.append(name)
+        print '{:<60} {:>8.2f}x{}'.format(
+            name, ratio, '  REGRESSION' if slower else ''
+        )
+    return regressions
+
+
+def main():
+    """
+    Runs suite as command line script.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    add_scale_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file to write results to')
+    parser.add_argument('--compare', help='JSON file with baseline results')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='allowed slowdown over baseline, 0.2 by default',
+    )
+    args = parser.parse_args()
+    users, days = parse_scale(args)
+
+    print '{} users, {} days'.format(users, days)
+    results = run(users, days, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'date': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'users': users,
+                'days': days,
+                'seed': args.seed,
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            baseline = json.load(baseline)
+        if (baseline['users'], baseline['days'], baseline['seed']) != (
+                users, days, args.seed):
+            parser.error('baseline was run on other data')
+        if compare(results, baseline['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Compares old per-user XPath users_view with the cached users index.
+"""
+import os
+import shutil
+import tempfile
+
+from lxml import etree
+
+from presence_analyzer import views
+from presence_analyzer.benchmarks import best_of, report
+from presence_analyzer.benchmarks.generator import write_csv, write_xml
+from presence_analyzer.main import app
+from presence_analyzer.utils import get_data, get_users, jsonify
+
+USERS = 10000
+
+
+@jsonify
+def old_users_view():
+    """
+    users_view body before users index was introduced.
+    """
+    with open(app.config['USERS_XML'], 'r') as xmlfile:
+        root = etree.fromstring(xmlfile.read())  # pylint: disable=no-member
+
+    def get_username(i):
+        """
+        Return user name from XML file or default string.
+        """
+        user = root[1].xpath("user[@id='{}']".format(i))
+        if user:
+            return user[0][1].text
+        return "User {}".format(i)
+
+    data = get_data()
+    return [
+        {'user_id': i, 'name': get_username(i)}
+        for i in data.keys()
+    ]
+
+
+def main():
+    """
+    Runs users_view benchmark on 10k-user XML.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    old_xml = app.config['USERS_XML']
+    try:
+        app.config['DATA_CSV'] = os.path.join(tmp_dir, 'data.csv')
+        app.config['USERS_XML'] = os.path.join(tmp_dir, 'users.xml')
+        write_csv(app.config['DATA_CSV'], USERS, 5)
+        write_xml(app.config['USERS_XML'], USERS)
+        get_data()
+        print '{} users'.format(USERS)
+
+        with app.test_request_context():
+            baseline = best_of(old_users_view, repeat=1)
+            report('users_view, XPath per user', baseline)
+
+            def cold_users_view():
+                """
+                users_view parsing XML file again.
+                """
+                get_users.invalidate()
+                return views.users_view()
+
+            report('users_view, index rebuilt', best_of(cold_users_view),
+                   baseline)
+            report(
+                'users_view, cached index', best_of(views.users_view), baseline
+            )
+    finally:
+        app.config['USERS_XML'] = old_xml
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Compression of responses.
+
+With COMPRESSION config option enabled, text, JSON and JavaScript
+responses of at least COMPRESSION_MIN_SIZE bytes are compressed with
+brotli, when it is installed, or gzip, as negotiated by Accept-Encoding.
+
+Compressed bodies of responses with ETag, i.e. static files and API
+responses, are kept in ``compressed_cache``, so every version of a
+payload is compressed once. ETags change with every version, old ones
+drop out of the cache as least recently used. Streamed responses are
+compressed on the fly with gzip.
+
+Compressed response gets ETag of the uncompressed one with encoding
+appended, e.g. "abc-gzip". Encoding is stripped from If-None-Match
+before views compare ETags and added back to ETag of 304 response.
+Responses vary on Accept-Encoding.
+"""
+import re
+import zlib
+
+from flask import g, request
+
+from presence_analyzer.main import app
+from presence_analyzer.utils import ResponseCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # pylint: disable=invalid-name
+
+COMPRESSIBLE = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+)
+GZIP_WBITS = 16 + zlib.MAX_WBITS  # zlib stream with gzip header
+
+# encoding appended to ETag of compressed response
+ETAG_ENCODING = re.compile(r'-(br|gzip)"')
+
+compressed_cache = ResponseCache(  # pylint: disable=invalid-name
+    'COMPRESSION_CACHE'
+)
+
+
+def compress(body, encoding):
+    """
+    Returns body compressed with given encoding.
+    """
+    if encoding == 'br':
+        return brotli.compress(body)
+    compressor = zlib.compressobj(
+        app.config['COMPRESSION_LEVEL'], zlib.DEFLATED, GZIP_WBITS
+    )
+    return compressor.compress(body) + compressor.flush()
+
+
+def gzip_chunks(chunks):
+    """
+    Yields gzip compressed chunks of streamed body.
+    """
+    compressor = zlib.compressobj(
+        app.config['COMPRESSION_LEVEL'], zlib.DEFLATED, GZIP_WBITS
+    )
+    for chunk in chunks:
+        chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def set_etag_encoding(response, encoding):
+    """
+    Appends encoding to ETag of response, if it has one.
+    """
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag('{}-{}'.format(etag, encoding), weak)
+
+
+@app.before_request
+def strip_etag_encoding():
+    """
+    Strips encoding from ETags in If-None-Match, remembering it.
+    """
+    header = request.environ.get('HTTP_IF_NONE_MATCH')
+    if not app.config['COMPRESSION'] or not header:
+        return
+    match = ETAG_ENCODING.search(header)
+    if match is not None:
+        g.etag_encoding = match.group(1)
+        request.environ['HTTP_IF_NONE_MATCH'] = ETAG_ENCODING.sub('"', header)
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compresses response body when client accepts it.
+    """
+    if not app.config['COMPRESSION']:
+        return response
+    if response.status_code == 304:
+        response.vary.add('Accept-Encoding')
+        encoding = getattr(g, 'etag_encoding', None)
+        if encoding is not None:
+            set_etag_encoding(response, encoding)
+        return response
+    if (response.status_code != 200 or
+            'Content-Encoding' in response.headers or
+            not response.mimetype.startswith(COMPRESSIBLE)):
+        return response
+    length = response.content_length
+    if length is not None and length < app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if response.is_streamed and response.content_length is None:
+        if not request.accept_encodings['gzip']:
+            return response
+        response.response = gzip_chunks(response.response)
+        response.headers['Content-Encoding'] = 'gzip'
+        set_etag_encoding(response, 'gzip')
+        return response
+
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+    etag = response.headers.get('ETag')
+    body = compressed_cache.get((etag, encoding)) if etag else None
+    if body is None:
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < app.config['COMPRESSION_MIN_SIZE']:
+            return response
+        body = compress(data, encoding)
+        if etag:
+            compressed_cache.put((etag, encoding), body)
+    else:
+        response.close()
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    set_etag_encoding(response, encoding)
+    return response
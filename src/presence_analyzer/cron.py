@@ -2,40 +2,98 @@
 """
 Cron tasks
 """
-import os.path
+import os
+import shutil
 import time
 import urllib2
 
+from lxml import etree
+from werkzeug.http import http_date
+
 from presence_analyzer.config import (
     BASE_XML_FILE,
     BASE_XML_URL,
 )
+from presence_analyzer.files import replacing
 
 DAY_IN_SECONDS = 86400  # seconds in one day
 
 
-def is_file_younger_than_one_day():
+def is_file_younger_than_one_day(path=BASE_XML_FILE):
+    u"""
+    Check if data file is present and was downloaded or found not
+    modified within the last day.
+    """
+    if not os.path.exists(path):
+        return False
+    checked = os.path.getmtime(path)
+    if os.path.exists(checked_path(path)):
+        checked = max(checked, os.path.getmtime(checked_path(path)))
+    return checked >= time.time() - DAY_IN_SECONDS
+
+
+def etag_path(path):
     u"""
-    Check if data file is present.
+    Returns path of file keeping ETag of downloaded file.
     """
-    return (
-        os.path.exists(BASE_XML_FILE)
-        and os.path.getctime(BASE_XML_FILE) >= time.time() - DAY_IN_SECONDS
-    )
+    return path + '.etag'
 
 
-def update_users_source():
+def checked_path(path):
+    u"""
+    Returns path of file touched when downloaded file was not modified.
+
+    Downloaded file itself is left alone, its modification time tells
+    the application when to reload it.
+    """
+    return path + '.checked'
+
+
+def update_users_source(url=BASE_XML_URL, path=BASE_XML_FILE):
     u"""
     Download remote XML with users data.
+
+    Request is conditional on ETag and modification time of the previous
+    download. New file is streamed to a temporary file and renamed into
+    place only when it parses, so readers never see a partial file.
+    Returns True when the file was replaced.
+
+    Running application notices the new file by its modification time,
+    get_users reloads it on next call.
     """
-    if not is_file_younger_than_one_day():
-        source_file = urllib2.urlopen(BASE_XML_URL)
-        destination_file = open(BASE_XML_FILE, "w")
-        data = source_file.read()
-        destination_file.write(data)
-        destination_file.close()
+    if is_file_younger_than_one_day(path):
+        return False
+
+    request = urllib2.Request(url)
+    if os.path.exists(path):
+        request.add_header(
+            'If-Modified-Since', http_date(os.path.getmtime(path))
+        )
+        if os.path.exists(etag_path(path)):
+            with open(etag_path(path)) as etag_file:
+                request.add_header('If-None-Match', etag_file.read())
+    try:
+        source_file = urllib2.urlopen(request)
+    except urllib2.HTTPError as error:
+        if error.code != 304:
+            raise
+        with open(checked_path(path), 'a'):
+            os.utime(checked_path(path), None)
+        return False
+
+    with replacing(path) as tmp_path:
+        with open(tmp_path, 'wb') as destination_file:
+            shutil.copyfileobj(source_file, destination_file)
         source_file.close()
-        return data
+        etree.parse(tmp_path)
+
+    etag = source_file.info().get('ETag')
+    if etag:
+        with open(etag_path(path), 'w') as etag_file:
+            etag_file.write(etag)
+    elif os.path.exists(etag_path(path)):
+        os.remove(etag_path(path))
+    return True
 
 
 if __name__ == '__main__':
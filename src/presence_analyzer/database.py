@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite storage of presence data.
+
+Alternative to reading DATA_CSV, selected with DATA_BACKEND = 'sqlite'.
+Database is built from the CSV file by ``flask-ctl import`` and replaced
+as a whole, like the binary snapshot. Dates are kept as ordinals and
+times as seconds since midnight, each entry with its weekday.
+
+Weekday statistics of every user are summed by SQLite once, on import,
+into ``weekday_stats`` table. Only they are loaded into memory, entries
+stay in the database and are queried by user and date range through
+the primary key. Databases built before ``weekday_stats`` was added have
+to be imported again.
+
+There is no index on weekday of entries: weekday grouping is served by
+``weekday_stats`` with (user_id, weekday) primary key, and within a date
+range it reads only the user's entries found by (user_id, date) key, so
+such index would only slow down import.
+"""
+from collections import Mapping
+from datetime import date
+from itertools import izip
+import logging
+import sqlite3
+import threading
+
+from presence_analyzer.files import replacing
+from presence_analyzer.rollups import build_rollups
+from presence_analyzer.store import PresenceStore, UserPresence, WeekdayStats
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+SCHEMA = """
+CREATE TABLE presence (
+    user_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date)
+);
+CREATE TABLE weekday_stats (
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    starts INTEGER NOT NULL,
+    ends INTEGER NOT NULL,
+    PRIMARY KEY (user_id, weekday)
+);
+"""
+INSERT = 'INSERT INTO presence VALUES (?, ?, ?, ?, ?)'
+INSERT_WEEKDAY_STATS = """
+INSERT INTO weekday_stats
+SELECT user_id, weekday, COUNT(*), SUM(end - start), SUM(start), SUM(end)
+FROM presence
+GROUP BY user_id, weekday
+"""
+WEEKDAY_STATS = """
+SELECT user_id, weekday, count, total, starts, ends
+FROM weekday_stats
+"""
+# queries of one user's entries between two date ordinals
+ENTRIES_BETWEEN = """
+SELECT date, start, end
+FROM presence
+WHERE user_id = ? AND date BETWEEN ? AND ?
+ORDER BY date
+"""
+COUNT_BETWEEN = """
+SELECT COUNT(*)
+FROM presence
+WHERE user_id = ? AND date BETWEEN ? AND ?
+"""
+WEEKDAY_STATS_BETWEEN = """
+SELECT weekday, COUNT(*), SUM(end - start), SUM(start), SUM(end)
+FROM presence
+WHERE user_id = ? AND date BETWEEN ? AND ?
+GROUP BY weekday
+"""
+
+# bounds of open date ranges
+FIRST_ORDINAL = date.min.toordinal()
+LAST_ORDINAL = date.max.toordinal()
+
+
+def database_path(csv_path):
+    """
+    Returns default path of database built from given CSV file.
+    """
+    return csv_path + '.sqlite'
+
+
+def save(data, path):
+    """
+    Writes PresenceStore to a new database at ``path``.
+
+    Entries are inserted in one transaction into a temporary file, which
+    is renamed into place.
+    """
+    with replacing(path) as tmp_path:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.executescript(SCHEMA)
+            with connection:
+                connection.executemany(INSERT, (
+                    (user_id, ordinal, (ordinal + 6) % 7, start, end)
+                    for user_id, items in data.iteritems()
+                    for ordinal, start, end in izip(
+                        items.dates, items.starts, items.ends
+                    )
+                ))
+                connection.execute(INSERT_WEEKDAY_STATS)
+        finally:
+            connection.close()
+
+
+def weekday_stats(rows):
+    """
+    Builds WeekdayStats from (weekday, count, total, starts, ends) rows.
+    """
+    stats = WeekdayStats([0] * 7, [0] * 7, [0] * 7, [0] * 7)
+    for row in rows:
+        for values, value in zip(stats, row[1:]):
+            values[row[0]] = value
+    return stats
+
+
+def date_bounds(first, last):
+    """
+    Returns date ordinals of range, open ends replaced with extreme dates.
+    """
+    return (
+        FIRST_ORDINAL if first is None else first,
+        LAST_ORDINAL if last is None else last,
+    )
+
+
+class DatabaseUser(Mapping):
+    """
+    Presence entries of a single user, queried from database on access.
+
+    Offers the part of UserPresence interface used by views, entries are
+    read into UserPresence only by ``between``.
+    """
+
+    def __init__(self, store, user_id):
+        self.store = store
+        self.user_id = user_id
+
+    def query(self, sql, first=None, last=None):
+        """
+        Executes query of entries between two date ordinals.
+        """
+        return self.store.execute(
+            sql, (self.user_id,) + date_bounds(first, last)
+        )
+
+    def between(self, first=None, last=None):
+        """
+        Returns UserPresence with entries between two date ordinals.
+        """
+        user = UserPresence()
+        for ordinal, start, end in self.query(ENTRIES_BETWEEN, first, last):
+            user.dates.append(ordinal)
+            user.starts.append(start)
+            user.ends.append(end)
+        return user
+
+    def count_between(self, first=None, last=None):
+        """
+        Returns number of entries between two date ordinals.
+        """
+        return self.query(COUNT_BETWEEN, first, last).fetchone()[0]
+
+    def weekday_stats(self, first=None, last=None):
+        """
+        Returns WeekdayStats of entries between two date ordinals.
+        """
+        return weekday_stats(self.query(WEEKDAY_STATS_BETWEEN, first, last))
+
+    def __getitem__(self, day):
+        ordinal = day.toordinal()
+        return self.between(ordinal, ordinal)[day]
+
+    def __iter__(self):
+        return iter(self.between())
+
+    def __len__(self):
+        return sum(self.store.weekday_table[self.user_id].counts)
+
+    def __repr__(self):
+        return '<DatabaseUser: {} entries>'.format(len(self))
+
+
+class DatabaseStore(PresenceStore):
+    """
+    PresenceStore of DatabaseUser objects, with weekday statistics and
+    rollups in memory.
+
+    Every thread queries the database through its own connection.
+    """
+
+    def __init__(self, path):
+        super(DatabaseStore, self).__init__()
+        self.path = path
+        self.local = threading.local()
+
+    def execute(self, sql, parameters=()):
+        """
+        Executes query with connection of current thread.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path)
+        return connection.execute(sql, parameters)
+
+
+def load(path):
+    """
+    Reads DatabaseStore with weekday statistics and rollups from database.
+    """
+    data = DatabaseStore(path)
+    rows = {}
+    for row in data.execute(WEEKDAY_STATS):
+        rows.setdefault(row[0], []).append(row[1:])
+    data.weekday_table = {
+        user_id: weekday_stats(user_rows)
+        for user_id, user_rows in rows.iteritems()
+    }
+    for user_id in data.weekday_table:
+        data[user_id] = DatabaseUser(data, user_id)
+    data.rollups = build_rollups(data.weekday_table)
+    log.debug('Read %d users from %s', len(data), path)
+    return data
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Weekday aggregation engines.
+
+The engine is selected with AGGREGATION_ENGINE config option: 'python'
+(default) or 'numpy'. NumPy engine works on UserPresence arrays with
+bincount grouped reductions and falls back to pure Python when numpy is
+not installed.
+"""
+import logging
+
+from presence_analyzer.main import app
+from presence_analyzer.store import WeekdayStats, sum_weekday_entries
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+if numpy is None:  # pragma: no cover
+    log.info('numpy is not installed, using pure Python aggregation')
+
+
+def use_numpy():
+    """
+    Checks if NumPy engine is configured and available.
+    """
+    return numpy is not None and app.config['AGGREGATION_ENGINE'] == 'numpy'
+
+
+def user_weekday_stats(items):
+    """
+    Sums presence entries of UserPresence by weekday with configured engine.
+    """
+    if use_numpy():
+        return numpy_weekday_stats(items)
+    return sum_weekday_entries(items.weekday_entries())
+
+
+def users_weekday_stats(data):
+    """
+    Returns {user_id: WeekdayStats} for all users with configured engine.
+    """
+    if use_numpy():
+        return numpy_users_weekday_stats(data)
+    return {
+        user_id: sum_weekday_entries(items.weekday_entries())
+        for user_id, items in data.iteritems()
+    }
+
+
+def _as_numpy(values):
+    """
+    Returns zero-copy numpy view of array('i').
+    """
+    return numpy.frombuffer(values, dtype='i')
+
+
+def _stats(groups, starts, ends, length):
+    """
+    Sums entries by group index, returns lists of python ints.
+    """
+    def grouped_sum(weights):
+        """
+        Sums weights by group, exact for sums below 2 ** 53.
+        """
+        return numpy.bincount(
+            groups, weights=weights, minlength=length
+        ).astype(numpy.int64).tolist()
+
+    return (
+        numpy.bincount(groups, minlength=length).tolist(),
+        grouped_sum(ends - starts),
+        grouped_sum(starts),
+        grouped_sum(ends),
+    )
+
+
+def numpy_weekday_stats(items):
+    """
+    NumPy version of utils.weekday_stats for UserPresence.
+    """
+    weekdays = (_as_numpy(items.dates) + 6) % 7
+    return WeekdayStats(*_stats(
+        weekdays, _as_numpy(items.starts), _as_numpy(items.ends), 7
+    ))
+
+
+def numpy_users_weekday_stats(data):
+    """
+    NumPy version of users_weekday_stats, one reduction for all users.
+    """
+    user_ids = list(data)
+    if not user_ids:
+        return {}
+    users = [data[user_id] for user_id in user_ids]
+    sizes = [len(items) for items in users]
+    dates = numpy.concatenate([_as_numpy(items.dates) for items in users])
+    groups = numpy.repeat(numpy.arange(len(users)) * 7, sizes)
+    groups += (dates + 6) % 7
+    counts, totals, starts, ends = _stats(
+        groups,
+        numpy.concatenate([_as_numpy(items.starts) for items in users]),
+        numpy.concatenate([_as_numpy(items.ends) for items in users]),
+        len(users) * 7,
+    )
+    return {
+        user_id: WeekdayStats(
+            counts[index * 7:index * 7 + 7],
+            totals[index * 7:index * 7 + 7],
+            starts[index * 7:index * 7 + 7],
+            ends[index * 7:index * 7 + 7],
+        )
+        for index, user_id in enumerate(user_ids)
+    }
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for files replaced while the application reads them.
+"""
+from contextlib import contextmanager
+import os
+import stat
+import tempfile
+
+
+def current_umask():
+    """
+    Returns umask of the process.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once, changing umask is not thread-safe
+UMASK = current_umask()
+
+
+def file_mode(path):
+    """
+    Returns permissions of existing file, or default ones for a new file.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0666 & ~UMASK
+
+
+@contextmanager
+def replacing(path):
+    """
+    Yields path of a temporary file which replaces ``path`` on success.
+
+    Temporary file is created next to ``path`` and renamed into place, so
+    readers never see a partial file. It gets permissions of the replaced
+    file, or default ones, instead of 0600 given by mkstemp, so processes
+    of other users can still read it. On error it is removed.
+    """
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    os.close(handle)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, file_mode(path))
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
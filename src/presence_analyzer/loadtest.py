@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Load testing of the application served by Paste threadpool server.
+
+Every combination of threadpool settings is served in a child process,
+like ``bin/paster serve`` does with deploy.ini, and driven by concurrent
+clients requesting a mix of pages and API calls they make. Latency
+percentiles, throughput and error rate of each run are reported and the
+cheapest settings close to the best throughput are recommended, see
+``bin/flask-ctl loadtest``.
+"""
+from collections import namedtuple
+import httplib
+from itertools import product
+import json
+import logging
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import urllib2
+
+try:
+    from paste import httpserver
+except ImportError:  # pragma: no cover
+    httpserver = None  # pylint: disable=invalid-name
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Paste threadpool options, as in [server:main] section of deploy.ini
+Settings = namedtuple('Settings', 'workers spawn_if_under max_requests')
+
+# outcome of one run, latencies in seconds
+Result = namedtuple(
+    'Result', 'settings requests throughput error_rate p50 p95 p99'
+)
+
+# (path, weight) pairs, {user} is replaced with a random user id; every
+# page is followed by users list and charts data of selected users
+MIX = [
+    ('/', 1),
+    ('/mean-time', 1),
+    ('/start-end', 1),
+    ('/api/v1/users', 3),
+    ('/api/v1/presence_weekday/{user}', 3),
+    ('/api/v1/mean_time_weekday/{user}', 3),
+    ('/api/v1/presence_start_end/{user}', 3),
+]
+TIMEOUT = 10  # seconds, longer requests fail
+
+
+def percentile(values, fraction):
+    """
+    Returns nearest-rank percentile of sorted values, 0 when empty.
+    """
+    if not values:
+        return 0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(settings, latencies, errors, seconds):
+    """
+    Returns Result of run from latencies of successful requests and
+    number of failed ones.
+    """
+    latencies = sorted(latencies)
+    requests = len(latencies) + errors
+    return Result(
+        settings,
+        requests,
+        len(latencies) / seconds if seconds else 0,
+        float(errors) / requests if requests else 0,
+        percentile(latencies, 0.5),
+        percentile(latencies, 0.95),
+        percentile(latencies, 0.99),
+    )
+
+
+def drive(base_url, user_ids, concurrency, duration, seed=0,
+          timeout=TIMEOUT):
+    """
+    Requests MIX of urls from ``concurrency`` threads for ``duration``
+    seconds.
+
+    Requests which fail, get error status, are dropped by server or take
+    longer than ``timeout`` seconds count as errors. Returns latencies of
+    successful requests, number of failed ones and elapsed time.
+    """
+    paths = [path for path, weight in MIX for _ in xrange(weight)]
+    latencies = []
+    errors = []
+
+    def client(number):
+        """
+        Requests random urls until deadline.
+        """
+        rand = random.Random(seed + number)
+        while time.time() < deadline:
+            url = base_url + rand.choice(paths).format(
+                user=rand.choice(user_ids)
+            )
+            started = time.time()
+            try:
+                urllib2.urlopen(url, timeout=timeout).read()
+            except (urllib2.URLError, httplib.HTTPException, socket.error,
+                    IOError):
+                errors.append(url)
+            else:
+                latencies.append(time.time() - started)
+
+    started = time.time()
+    deadline = started + duration
+    clients = [
+        threading.Thread(target=client, args=(number,))
+        for number in xrange(concurrency)
+    ]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, len(errors), time.time() - started
+
+
+def serve(app, settings):
+    """
+    Returns Paste threadpool server of ``app`` on a free local port.
+    """
+    return httpserver.serve(
+        app,
+        host='127.0.0.1',
+        port=0,
+        start_loop=False,
+        use_threadpool=True,
+        threadpool_workers=settings.workers,
+        threadpool_options={
+            'spawn_if_under': settings.spawn_if_under,
+            'max_requests': settings.max_requests,
+        },
+    )
+
+
+def server_process(app_factory, settings, server_factory, ports):
+    """
+    Serves application in child process, sends server port to parent.
+    """
+    server = server_factory(app_factory(), settings)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def run(app_factory, settings, concurrency, duration, seed=0,
+        server_factory=serve):
+    """
+    Serves application from ``app_factory`` with given Settings in
+    a child process and drives it with MIX of requests.
+
+    Returns Result.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=server_process,
+        args=(app_factory, settings, server_factory, ports),
+    )
+    process.daemon = True
+    process.start()
+    try:
+        base_url = 'http://127.0.0.1:{}'.format(ports.get(timeout=60))
+        users = json.load(urllib2.urlopen(
+            base_url + '/api/v1/users', timeout=TIMEOUT
+        ))
+        user_ids = [user['user_id'] for user in users] or [0]
+        # warm up caches of loaders and responses
+        drive(base_url, user_ids, 1, min(duration, 1), seed)
+        return summarize(
+            settings, *drive(base_url, user_ids, concurrency, duration, seed)
+        )
+    finally:
+        process.terminate()
+        process.join()
+
+
+def sweep(app_factory, grid, concurrency, duration, seed=0,
+          server_factory=serve):
+    """
+    Runs load test with every combination of ``grid`` Settings values,
+    given as lists.
+
+    Returns list of Results.
+    """
+    results = []
+    for values in product(*grid):
+        settings = Settings(*values)
+        log.info('Testing %s', settings)
+        results.append(run(
+            app_factory, settings, concurrency, duration, seed, server_factory
+        ))
+    return results
+
+
+def recommend(results, max_error_rate=0.01, tolerance=0.05):
+    """
+    Returns Result with settings worth deploying, None when all failed.
+
+    Of results with error rate up to ``max_error_rate`` and throughput at
+    most ``tolerance`` below the best one, the one with the fewest
+    workers and then the lowest p99 latency wins. Runs without any
+    requests are treated as failed.
+    """
+    results = [
+        result for result in results
+        if result.requests and result.error_rate <= max_error_rate
+    ]
+    if not results:
+        return None
+    best = max(result.throughput for result in results)
+    return min(
+        (
+            result for result in results
+            if result.throughput >= best * (1 - tolerance)
+        ),
+        key=lambda result: (result.settings.workers, result.p99),
+    )
+
+
+def report(result):
+    """
+    Returns Result as a table line.
+    """
+    return (
+        '{0.workers:>7} {0.spawn_if_under:>14} {0.max_requests:>12} '
+        '{1.requests:>8} {1.throughput:>8.1f}/s {2:>6.2f}% '
+        '{3:>8.1f} {4:>8.1f} {5:>8.1f} ms'
+    ).format(
+        result.settings,
+        result,
+        result.error_rate * 100,
+        result.p50 * 1000,
+        result.p95 * 1000,
+        result.p99 * 1000,
+    )
+
+
+# header of report() lines
+HEADER = (
+    'workers spawn_if_under max_requests requests throughput errors '
+    '     p50      p95      p99'
+)
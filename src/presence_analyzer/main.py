@@ -5,6 +5,32 @@ Flask app initialization.
 from flask import Flask
 import flask_mako as fmako  # pylint: disable=unused-import
 
+from presence_analyzer.config import BASE_XML_FILE
+
 app = Flask(__name__)  # pylint: disable=invalid-name
 mako = fmako.MakoTemplates(app)  # pylint: disable=invalid-name
 app.template_folder = "templates"
+app.config.update(
+    AGGREGATION_ENGINE='python',  # or 'numpy'
+    COMPRESSION=False,  # gzip/brotli responses, see compression module
+    COMPRESSION_LEVEL=6,
+    COMPRESSION_MIN_SIZE=500,  # bytes
+    COMPRESSION_CACHE_ENTRIES=256,
+    COMPRESSION_CACHE_BYTES=16 * 1024 * 1024,
+    DATA_BACKEND='csv',  # or 'sqlite', see database module
+    DATA_SQLITE=None,  # DATA_CSV + '.sqlite' by default
+    DATA_SHARED=False,  # see shared module
+    DATA_SNAPSHOT=False,
+    DATA_WORKERS=1,  # processes parsing DATA_CSV
+    JSON_SERIALIZER='json',  # or 'ujson', 'orjson', 'auto'
+    JSON_CHUNK_ITEMS=1000,  # longer lists are streamed in chunks
+    METRICS=False,  # timing histograms and Server-Timing header
+    PROFILER=False,  # profiling of requests, see profiling module
+    PROFILER_DIR=None,  # var/profiles by default
+    PROFILER_HEADER='X-Profile',  # requests with this header are profiled
+    PROFILER_SAMPLE_RATE=0.0,  # and this fraction of other requests
+    REFRESH_INTERVAL=0,  # seconds between source files checks, 0 disables
+    USERS_XML=BASE_XML_FILE,
+    RESPONSE_CACHE_ENTRIES=1024,
+    RESPONSE_CACHE_BYTES=16 * 1024 * 1024,
+)
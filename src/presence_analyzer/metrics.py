@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Timing instrumentation.
+
+Functions wrapped with ``timed`` record their duration in in-process
+histograms and, inside a request, in its Server-Timing header. Nothing
+is recorded unless METRICS config option is enabled. Histograms and
+registered values are rendered in Prometheus text format by ``render``.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import wraps
+import threading
+from timeit import default_timer
+
+from flask import g, has_request_context, request
+
+from presence_analyzer.main import app
+
+# upper bounds of histogram buckets, in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0, 30.0,
+)
+PREFIX = 'presence_analyzer_'
+
+
+class Histogram(object):
+    """
+    Cumulative histogram of observed durations.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Records single value.
+        """
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        """
+        Returns list of (upper bound, cumulative count) pairs, total count
+        and sum of observed values.
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        result = []
+        count = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            count += bucket_count
+            result.append((bound, count))
+        return result, count, total
+
+
+# histogram families: name -> (help, label, {label value: Histogram})
+histograms = OrderedDict([  # pylint: disable=invalid-name
+    ('section_seconds', (
+        'Time spent in instrumented code sections.', 'section', {}
+    )),
+    ('request_seconds', (
+        'Time spent handling requests, by endpoint.', 'endpoint', {}
+    )),
+])
+# other exported values: name -> (type, help, function returning value)
+values = OrderedDict()  # pylint: disable=invalid-name
+
+
+def observe(family, label, seconds):
+    """
+    Records duration in histogram of given family and label value.
+    """
+    family = histograms[family][2]
+    histogram = family.get(label)
+    if histogram is None:
+        histogram = family.setdefault(label, Histogram())
+    histogram.observe(seconds)
+
+
+def record(name, seconds):
+    """
+    Records duration of code section, also for Server-Timing header.
+    """
+    observe('section_seconds', name, seconds)
+    if has_request_context():
+        timings = getattr(g, 'timings', None)
+        if timings is None:
+            timings = g.timings = []
+        timings.append((name, seconds))
+
+
+def timed(name):
+    """
+    Records duration of wrapped function calls under given name.
+    """
+    def decorator(function):
+        """
+        Wraps function with timing.
+        """
+        @wraps(function)
+        def inner(*args, **kwargs):
+            """
+            This docstring will be overridden by @wraps decorator.
+            """
+            if not app.config['METRICS']:
+                return function(*args, **kwargs)
+            start = default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, default_timer() - start)
+        return inner
+    return decorator
+
+
+def register(name, kind, description, function):
+    """
+    Exports value returned by function, ``kind`` is Prometheus metric type.
+    """
+    values[name] = (kind, description, function)
+
+
+@app.before_request
+def start_timer():
+    """
+    Notes request start time.
+    """
+    if app.config['METRICS']:
+        g.request_started = default_timer()
+
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Records request duration and sends recorded timings in Server-Timing
+    header.
+    """
+    started = getattr(g, 'request_started', None)
+    if started is None:
+        return response
+    total = default_timer() - started
+    observe('request_seconds', request.endpoint or 'unknown', total)
+    timings = getattr(g, 'timings', []) + [('total', total)]
+    response.headers['Server-Timing'] = ', '.join(
+        '{};dur={:.3f}'.format(name, seconds * 1000)
+        for name, seconds in timings
+    )
+    return response
+
+
+def format_value(value):
+    """
+    Formats sample value or bucket bound.
+    """
+    return value if isinstance(value, basestring) else repr(float(value))
+
+
+def render():
+    """
+    Returns all metrics in Prometheus text exposition format.
+    """
+    lines = []
+    for name, (description, label, family) in histograms.iteritems():
+        name = PREFIX + name
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} histogram'.format(name))
+        for label_value, histogram in sorted(family.items()):
+            labels = '{}="{}"'.format(label, label_value)
+            buckets, count, total = histogram.samples()
+            for bound, bucket_count in buckets:
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    name, labels, format_value(bound), bucket_count
+                ))
+            lines.append('{}_sum{{{}}} {}'.format(
+                name, labels, format_value(total)
+            ))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, count))
+    for name, (kind, description, function) in values.iteritems():
+        name = PREFIX + name
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        lines.append('{} {}'.format(name, format_value(function())))
+    return '\n'.join(lines) + '\n'
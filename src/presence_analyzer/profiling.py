@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of single requests.
+
+``ProfilerMiddleware`` wraps WSGI application and runs requests carrying
+the trigger header, or a random sample of them, under cProfile. Stats are
+dumped to files named by endpoint and time, readable with ``pstats``, and
+listed with their top hotspots on an index page.
+"""
+import cProfile
+import cgi
+import logging
+import os
+import pstats
+import random
+import re
+import time
+
+from werkzeug.exceptions import HTTPException
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+SUFFIX = '.prof'
+
+
+class ProfilerMiddleware(object):
+    """
+    Profiles requests of wrapped WSGI application.
+
+    Options:
+     - directory: where stats files are written,
+     - url_map: werkzeug Map used to name files by endpoint,
+     - header: request header triggering profiling,
+     - sample_rate: fraction of other requests to profile,
+     - keep: number of most recent stats files kept,
+     - index_path: path of page listing recent profiles.
+    """
+
+    def __init__(self, app, directory, url_map=None, header='X-Profile',
+                 sample_rate=0.0, keep=100, index_path='/_profiles'):
+        self.app = app
+        self.directory = directory
+        self.url_map = url_map
+        self.environ_key = 'HTTP_' + header.upper().replace('-', '_')
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.index_path = index_path
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == self.index_path:
+            return self.index(start_response)
+        if not (environ.get(self.environ_key) or
+                random.random() < self.sample_rate):
+            return self.app(environ, start_response)
+
+        profile = cProfile.Profile()
+        body = profile.runcall(self.run, environ, start_response)
+        try:
+            self.save(profile, self.endpoint(environ))
+        except (IOError, OSError):
+            log.exception('Cannot save profile')
+        return body
+
+    def run(self, environ, start_response):
+        """
+        Calls application and reads whole response body.
+        """
+        app_iter = self.app(environ, start_response)
+        try:
+            return list(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def endpoint(self, environ):
+        """
+        Returns endpoint name of request, or its path when it has none.
+        """
+        if self.url_map is not None:
+            try:
+                return self.url_map.bind_to_environ(environ).match()[0]
+            except HTTPException:
+                pass
+        return re.sub(r'\W+', '_', environ.get('PATH_INFO', '')).strip('_')
+
+    def save(self, profile, endpoint):
+        """
+        Dumps stats to a new file and removes the oldest ones.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        now = time.time()
+        name = '{}.{}.{:03d}{}'.format(
+            endpoint or 'root',
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+            int(now * 1000) % 1000,
+            SUFFIX,
+        )
+        profile.dump_stats(os.path.join(self.directory, name))
+        for old_name in self.profiles()[self.keep:]:
+            os.remove(os.path.join(self.directory, old_name))
+
+    def profiles(self):
+        """
+        Returns names of stats files, the newest first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            (name for name in os.listdir(self.directory)
+             if name.endswith(SUFFIX)),
+            key=lambda name: os.path.getmtime(
+                os.path.join(self.directory, name)
+            ),
+            reverse=True,
+        )
+
+    def index(self, start_response, limit=20, hotspots=5):
+        """
+        Renders page listing recent profiles with their top hotspots.
+        """
+        lines = [
+            '<!DOCTYPE html>',
+            '<html><head><title>Profiles</title></head><body>',
+            '<h1>Recent profiles</h1>',
+        ]
+        for name in self.profiles()[:limit]:
+            lines.append('<h2>{}</h2>'.format(cgi.escape(name)))
+            lines.append('<table><tr><th>own time (ms)</th>'
+                         '<th>calls</th><th>function</th></tr>')
+            for function, calls, own_time in top_functions(
+                    os.path.join(self.directory, name), hotspots
+            ):
+                lines.append(
+                    '<tr><td>{:.3f}</td><td>{}</td><td>{}</td></tr>'.format(
+                        own_time * 1000, calls, cgi.escape(function)
+                    )
+                )
+            lines.append('</table>')
+        lines.append('</body></html>')
+        body = '\n'.join(lines)
+        start_response('200 OK', [
+            ('Content-Type', 'text/html; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+
+def top_functions(path, limit):
+    """
+    Returns (function, calls, own time) of functions with the most own
+    time in stats file.
+    """
+    stats = pstats.Stats(path).stats  # pylint: disable=no-member
+    result = [
+        ('{2} ({0}:{1})'.format(*function), calls, own_time)
+        for function, (_, calls, own_time, _, _) in stats.iteritems()
+    ]
+    result.sort(key=lambda item: item[2], reverse=True)
+    return result[:limit]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Background reloading of presence data and users index.
+
+Refresher thread polls source files of cached loaders and rebuilds their
+values off the request path. While it runs, requests get the last value
+loaded successfully and never wait for parsing a changed file.
+"""
+import logging
+import threading
+
+from presence_analyzer.main import app
+from presence_analyzer.utils import get_data, get_users
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class Refresher(threading.Thread):
+    """
+    Daemon thread refreshing given FileCache loaders every ``interval``
+    seconds.
+    """
+
+    def __init__(self, caches, interval):
+        super(Refresher, self).__init__(name='presence-refresher')
+        self.daemon = True
+        self.caches = caches
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        """
+        Refreshes all loaders once.
+        """
+        for cache in self.caches:
+            if cache.refresh():
+                log.info('Reloaded %s', cache.__name__)
+
+    def run(self):
+        while True:
+            self.refresh()
+            if self.stopped.wait(self.interval):
+                break
+
+    def start(self):
+        """
+        Loads current values and starts polling source files.
+        """
+        self.refresh()
+        for cache in self.caches:
+            cache.background = True
+        super(Refresher, self).start()
+
+    def stop(self):
+        """
+        Stops polling, loaders check source files on calls again.
+        """
+        self.stopped.set()
+        self.join()
+        for cache in self.caches:
+            cache.background = False
+
+
+def start_refresher(interval=None):
+    """
+    Starts refresher of presence data and users index.
+
+    Interval defaults to REFRESH_INTERVAL config value, refresher is not
+    started when it is 0. Only one refresher runs per application.
+    """
+    if interval is None:
+        interval = app.config['REFRESH_INTERVAL']
+    refresher = app.extensions.get('presence_refresher')
+    if not interval or refresher is not None:
+        return refresher
+    refresher = Refresher([get_data, get_users], interval)
+    refresher.start()
+    app.extensions['presence_refresher'] = refresher
+    return refresher
+
+
+def stop_refresher():
+    """
+    Stops running refresher, if any.
+    """
+    refresher = app.extensions.pop('presence_refresher', None)
+    if refresher is not None:
+        refresher.stop()
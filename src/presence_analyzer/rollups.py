@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Company-wide presence rollups and rankings of users.
+
+Rollups are built from per-user WeekdayStats by the loader, right after
+``weekday_table``, so serving them costs no pass over presence entries.
+Rankings select top users with a heap instead of sorting all of them.
+"""
+import heapq
+from collections import namedtuple
+
+from presence_analyzer.store import WeekdayStats
+
+# totals of one user: number of days, total presence and mean presence,
+# start and end, all in seconds
+UserSummary = namedtuple('UserSummary', 'days total presence start end')
+
+# company WeekdayStats and {user_id: UserSummary}
+Rollups = namedtuple('Rollups', 'company users')
+
+# keys users can be ranked by
+RANKINGS = UserSummary._fields
+
+
+def merge_weekday_stats(stats):
+    """
+    Sums WeekdayStats of many users into one.
+    """
+    counts = [0] * 7
+    totals = [0] * 7
+    starts = [0] * 7
+    ends = [0] * 7
+    for item in stats:
+        for result, values in zip(
+                (counts, totals, starts, ends), item
+        ):
+            for weekday, value in enumerate(values):
+                result[weekday] += value
+    return WeekdayStats(counts, totals, starts, ends)
+
+
+def summarize(stats):
+    """
+    Returns UserSummary of WeekdayStats.
+    """
+    days = sum(stats.counts)
+    if not days:
+        return UserSummary(0, 0, 0, 0, 0)
+    total = sum(stats.totals)
+    return UserSummary(
+        days,
+        total,
+        float(total) / days,
+        float(sum(stats.starts)) / days,
+        float(sum(stats.ends)) / days,
+    )
+
+
+def build_rollups(weekday_table):
+    """
+    Returns Rollups of {user_id: WeekdayStats} table.
+    """
+    return Rollups(
+        merge_weekday_stats(weekday_table.itervalues()),
+        {
+            user_id: summarize(stats)
+            for user_id, stats in weekday_table.iteritems()
+        },
+    )
+
+
+def top_users(summaries, key, number, ascending=False):
+    """
+    Returns ``number`` of (user_id, value) pairs with the highest, or the
+    lowest, values of UserSummary field ``key``.
+
+    Users without entries are skipped.
+    """
+    index = RANKINGS.index(key)
+    items = (
+        (user_id, summary[index])
+        for user_id, summary in summaries.iteritems()
+        if summary.days
+    )
+    # ties go to lower user ids
+    if ascending:
+        return heapq.nsmallest(number, items, key=lambda item: item[::-1])
+    return heapq.nlargest(
+        number, items, key=lambda item: (item[1], -item[0])
+    )
@@ -26,10 +26,23 @@ del _buildout_path
 
 
 # bin/paster serve parts/etc/deploy.ini
-def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
+def make_app(global_conf={}, config=DEPLOY_CFG, debug=False, refresh=True):
     from presence_analyzer import app
+    from presence_analyzer.profiling import ProfilerMiddleware
+    from presence_analyzer.refresh import start_refresher
     app.config.from_pyfile(abspath(config))
     app.debug = debug
+    if refresh:
+        start_refresher()
+    if (app.config['PROFILER'] and
+            not isinstance(app.wsgi_app, ProfilerMiddleware)):
+        app.wsgi_app = ProfilerMiddleware(
+            app.wsgi_app,
+            app.config['PROFILER_DIR'] or abspath('var', 'profiles'),
+            url_map=app.url_map,
+            header=app.config['PROFILER_HEADER'],
+            sample_rate=app.config['PROFILER_SAMPLE_RATE'],
+        )
     return app
 
 
@@ -100,6 +113,84 @@ def run():
         """Serve the debugging application."""
         _serve(action, debug=True, dry_run=dry_run)
 
+    # bin/flask-ctl snapshot
+    def action_snapshot(debug=False):
+        """Prebuild binary snapshot of presence data.
+
+        Options:
+         - '--debug' use the debugging configuration
+        """
+        from presence_analyzer import snapshot
+        from presence_analyzer.utils import read_data
+        app = make_app(
+            config=DEBUG_CFG if debug else DEPLOY_CFG, refresh=False
+        )
+        path = app.config['DATA_CSV']
+        snapshot.save(read_data(path), path)
+        print 'Saved', snapshot.snapshot_path(path)
+
+    # bin/flask-ctl import
+    def action_import(debug=False):
+        """Import presence CSV into SQLite database.
+
+        Options:
+         - '--debug' use the debugging configuration
+        """
+        from presence_analyzer import database
+        from presence_analyzer.utils import read_data
+        app = make_app(
+            config=DEBUG_CFG if debug else DEPLOY_CFG, refresh=False
+        )
+        path = app.config['DATA_SQLITE'] or database.database_path(
+            app.config['DATA_CSV']
+        )
+        database.save(read_data(app.config['DATA_CSV']), path)
+        print 'Saved', path
+
+    # bin/flask-ctl loadtest
+    def action_loadtest(debug=False, config='', concurrency=20,
+                        duration=10.0, workers='10,25,50',
+                        spawn_if_under='5', max_requests='0,200', seed=0):
+        """Load test the application with Paste threadpool settings.
+
+        The application is served locally with every combination of
+        given threadpool settings and driven by concurrent clients with
+        a mix of page and API requests. Latency percentiles, throughput
+        and error rate of every run are printed, followed by recommended
+        settings for deploy.ini.
+
+        Options:
+         - '--debug' use the debugging configuration
+         - '--config' application config file, overrides '--debug'
+         - '--concurrency' number of simultaneous clients
+         - '--duration' seconds of load for every settings
+         - '--workers', '--spawn-if-under', '--max-requests' comma
+           separated values of threadpool options to try
+        """
+        from presence_analyzer import loadtest
+        if loadtest.httpserver is None:
+            sys.exit('Paste is required to run load test')
+        config = config or (DEBUG_CFG if debug else DEPLOY_CFG)
+        grid = [
+            [int(value) for value in values.split(',')]
+            for values in (workers, spawn_if_under, max_requests)
+        ]
+        print loadtest.HEADER
+        results = []
+        for result in loadtest.sweep(
+                partial(make_app, config=config), grid, concurrency,
+                duration, seed):
+            print loadtest.report(result)
+            results.append(result)
+        best = loadtest.recommend(results)
+        if best is None:
+            sys.exit('All runs failed, see error rates above')
+        print
+        print 'Recommended [server:main] settings:'
+        print 'threadpool_workers =', best.settings.workers
+        print 'threadpool_spawn_if_under =', best.settings.spawn_if_under
+        print 'threadpool_max_requests =', best.settings.max_requests
+
     # bin/flask-ctl status
     def action_status(dry_run=False):
         """Status of the application."""
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+JSON serializers.
+
+The serializer is selected with JSON_SERIALIZER config option: 'json'
+(default), 'ujson', 'orjson' or 'auto' for orjson when it is installed.
+Missing libraries fall back to the standard json module. ujson is not
+picked by 'auto', on API responses it is not faster than the json C
+encoder (see benchmarks.serializers).
+
+Only 'json' gives byte-identical output of json.dumps, used by API
+responses so far. The others write equivalent compact JSON, without
+spaces after separators and, in case of ujson, with floats rounded to
+15 significant digits.
+"""
+from collections import OrderedDict
+import json
+
+from presence_analyzer.main import app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # pylint: disable=invalid-name
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None  # pylint: disable=invalid-name
+
+
+def json_dumps(value):
+    """
+    Serializes value with standard json module.
+    """
+    return json.dumps(value)
+
+
+def ujson_dumps(value):
+    """
+    Serializes value with ujson.
+    """
+    return ujson.dumps(
+        value, double_precision=15, escape_forward_slashes=False
+    )
+
+
+def orjson_dumps(value):
+    """
+    Serializes value with orjson.
+    """
+    return orjson.dumps(value)
+
+
+# name -> (function, separator of list items), the one used by 'auto'
+# first
+SERIALIZERS = OrderedDict(
+    (name, serializer) for name, library, serializer in [
+        ('orjson', orjson, (orjson_dumps, ',')),
+        ('json', json, (json_dumps, ', ')),
+        ('ujson', ujson, (ujson_dumps, ',')),
+    ]
+    if library is not None
+)
+
+
+def get_serializer():
+    """
+    Returns (function, separator) pair of configured serializer.
+    """
+    name = app.config['JSON_SERIALIZER']
+    if name == 'auto':
+        return next(SERIALIZERS.itervalues())
+    return SERIALIZERS.get(name, SERIALIZERS['json'])
+
+
+def dumps(value):
+    """
+    Returns JSON representation of value with configured serializer.
+    """
+    return get_serializer()[0](value)
+
+
+def dumps_chunks(value, chunk_items):
+    """
+    Yields JSON representation of a list in parts of ``chunk_items`` items.
+
+    Parts joined together are equal to ``dumps(value)``.
+    """
+    function, separator = get_serializer()
+    if not value:
+        yield function(value)
+        return
+    yield '['
+    for start in xrange(0, len(value), chunk_items):
+        if start:
+            yield separator
+        yield function(value[start:start + chunk_items])[1:-1]
+    yield ']'
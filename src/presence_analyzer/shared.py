@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Presence data shared by processes through a memory-mapped file.
+
+With DATA_SHARED config option enabled, the first process which needs
+data of the current DATA_CSV parses it and publishes it as a dataset
+file next to it. Every process, this one included, maps the file
+read-only and reads entries straight from the mapping, so all of them
+share one copy of the data in the page cache. Only the per-user index
+with weekday statistics is read into memory.
+
+File layout, little-endian:
+    header, last CSV line,
+    index sorted by user_id: user entry with weekday statistics,
+    dates, starts and ends of all entries as int32 arrays, entries of
+    every user next to each other.
+
+Generation counter in the header grows with every publication. Process
+waiting for another one to publish compares it to tell if the file was
+replaced meanwhile.
+"""
+from array import array
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from presence_analyzer.files import replacing
+from presence_analyzer.rollups import build_rollups
+from presence_analyzer.store import (
+    CsvPosition,
+    PresenceStore,
+    UserPresence,
+    WeekdayStats,
+)
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MAGIC = 'PRSHARED'
+VERSION = 1
+# magic, version, generation, CSV size, CSV mtime, CSV inode, rows,
+# number of users, length of last line
+HEADER = struct.Struct('<8sHQQdQQIH')
+# user_id, index of first entry, number of entries, weekday statistics
+INDEX = struct.Struct('<qQI28q')
+ITEM = struct.Struct('<i')
+
+
+def shared_path(csv_path):
+    """
+    Returns path of dataset file for given CSV file.
+    """
+    return csv_path + '.shared'
+
+
+class MappedArray(object):
+    """
+    Read-only sequence of int32 values in a memory-mapped buffer.
+
+    Supports what UserPresence needs from its arrays: indexing, used by
+    bisect, slices, which are copied into array('i'), and iteration.
+    """
+
+    def __init__(self, buf, offset, length):
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            values = array('i')
+            if start < stop:
+                values.fromstring(self.buf[
+                    self.offset + start * ITEM.size:
+                    self.offset + stop * ITEM.size
+                ])
+            return values[::step] if step != 1 else values
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('index out of range')
+        return ITEM.unpack_from(self.buf, self.offset + index * ITEM.size)[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __eq__(self, other):
+        return self[:] == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def tostring(self):
+        """
+        Returns values as machine values.
+        """
+        return self.buf[
+            self.offset:self.offset + self.length * ITEM.size
+        ]
+
+
+class SharedStore(PresenceStore):
+    """
+    PresenceStore with entries in a mapped dataset file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SharedStore, self).__init__(*args, **kwargs)
+        self.generation = None
+
+
+def read_header(buf):
+    """
+    Returns header fields of dataset buffer, or None for other files.
+    """
+    fields = HEADER.unpack_from(buf)
+    if fields[:2] != (MAGIC, VERSION):
+        return None
+    return fields
+
+
+def current_generation(path):
+    """
+    Returns generation of dataset file, 0 when there is none.
+    """
+    try:
+        with open(path, 'rb') as source:
+            fields = read_header(source.read(HEADER.size))
+    except (IOError, OSError, struct.error):
+        return 0
+    return fields[2] if fields is not None else 0
+
+
+def publish(data, csv_path):
+    """
+    Writes PresenceStore read from ``csv_path`` as a new dataset file.
+
+    File is written to a temporary file and renamed into place, processes
+    attached to the old one keep using it until they remap.
+    """
+    position = data.position
+    stat = os.stat(csv_path)
+    if stat.st_ino != position.inode or stat.st_size != position.offset:
+        log.debug('%s changed while reading, not published', csv_path)
+        return
+    if sys.byteorder != 'little':  # pragma: no cover
+        log.warning('Shared presence data needs little-endian machine')
+        return
+
+    path = shared_path(csv_path)
+    generation = current_generation(path) + 1
+    user_ids = sorted(data)
+    with replacing(path) as tmp_path:
+        with open(tmp_path, 'wb') as target:
+            target.write(HEADER.pack(
+                MAGIC,
+                VERSION,
+                generation,
+                position.offset,
+                stat.st_mtime,
+                position.inode,
+                position.rows,
+                len(user_ids),
+                len(position.last_line),
+            ))
+            target.write(position.last_line)
+            first = 0
+            for user_id in user_ids:
+                stats = data.weekday_table[user_id]
+                target.write(INDEX.pack(
+                    user_id,
+                    first,
+                    len(data[user_id]),
+                    *(stats.counts + stats.totals + stats.starts + stats.ends)
+                ))
+                first += len(data[user_id])
+            for name in ('dates', 'starts', 'ends'):
+                for user_id in user_ids:
+                    target.write(getattr(data[user_id], name).tostring())
+    log.info('Published presence data generation %d', generation)
+
+
+def attach(csv_path):
+    """
+    Maps dataset file of ``csv_path`` into SharedStore.
+
+    Returns None when there is no dataset file or it is stale or broken.
+    """
+    path = shared_path(csv_path)
+    try:
+        with open(path, 'rb') as source:
+            buf = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        return read(buf, csv_path)
+    except struct.error:
+        log.warning('Broken shared presence data %s', path)
+        return None
+
+
+def read(buf, csv_path):
+    """
+    Reads index of dataset buffer if it matches the CSV file.
+    """
+    fields = read_header(buf)
+    if fields is None:
+        return None
+    (_, _, generation, size, mtime, inode, rows, users,
+     last_line_size) = fields
+    stat = os.stat(csv_path)
+    if (stat.st_size, stat.st_mtime, stat.st_ino) != (size, mtime, inode):
+        return None
+
+    offset = HEADER.size + last_line_size
+    entries = offset + users * INDEX.size
+    total = 0
+    data = SharedStore()
+    data.generation = generation
+    data.position = CsvPosition(
+        inode, size, rows, buf[HEADER.size:offset]
+    )
+    for _ in xrange(users):
+        fields = INDEX.unpack_from(buf, offset)
+        offset += INDEX.size
+        user_id, first, count = fields[:3]
+        stats = list(fields[3:])
+        data.weekday_table[user_id] = WeekdayStats(
+            stats[0:7], stats[7:14], stats[14:21], stats[21:28]
+        )
+        data[user_id] = (first, count)
+        total += count
+
+    if len(buf) != entries + 3 * total * ITEM.size:
+        raise struct.error('unexpected size of shared presence data')
+    for user_id, (first, count) in data.items():
+        items = UserPresence()
+        for number, name in enumerate(('dates', 'starts', 'ends')):
+            setattr(items, name, MappedArray(
+                buf, entries + (number * total + first) * ITEM.size, count
+            ))
+        data[user_id] = items
+    data.rollups = build_rollups(data.weekday_table)
+    return data
+
+
+def load(csv_path, build):
+    """
+    Returns SharedStore of ``csv_path``, built with ``build(csv_path)`` and
+    published when there is no current dataset file.
+
+    Processes building at the same time are serialized with a lock file,
+    the ones waiting attach to data published meanwhile.
+    """
+    data = attach(csv_path)
+    if data is not None:
+        return data
+
+    path = shared_path(csv_path)
+    generation = current_generation(path)
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if current_generation(path) != generation:
+                data = attach(csv_path)
+                if data is not None:
+                    return data
+            publish(build(csv_path), csv_path)
+            data = attach(csv_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    if data is None:
+        # file changed while it was read, serve private copy this time
+        data = build(csv_path)
+    return data
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Binary snapshot of parsed presence data.
+
+Snapshot is written next to the CSV file and lets a fresh process skip
+parsing it. It is valid while the CSV file has the same size and mtime,
+or the same size and content hash, as when the snapshot was written.
+
+File layout, little-endian:
+    header, last CSV line,
+    for every user: user entry, dates, starts and ends as int32 arrays,
+    weekday statistics as 28 int64 values.
+"""
+from array import array
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from presence_analyzer.files import replacing
+from presence_analyzer.rollups import build_rollups
+from presence_analyzer.store import (
+    CsvPosition,
+    PresenceStore,
+    UserPresence,
+    WeekdayStats,
+)
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MAGIC = 'PRESENCE'
+VERSION = 1
+# magic, version, CSV size, CSV mtime, CSV inode, rows, CSV sha1,
+# number of users, length of last line
+HEADER = struct.Struct('<8sHQdQQ20sIH')
+USER = struct.Struct('<qI')  # user_id, number of entries
+STATS = struct.Struct('<28q')
+
+
+def snapshot_path(csv_path):
+    """
+    Returns path of snapshot for given CSV file.
+    """
+    return csv_path + '.snapshot'
+
+
+def file_hash(path, size):
+    """
+    Returns SHA-1 digest of first ``size`` bytes of the file.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        while size > 0:
+            chunk = source.read(min(size, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            size -= len(chunk)
+    return digest.digest()
+
+
+def save(data, csv_path):
+    """
+    Writes snapshot of PresenceStore read from ``csv_path``.
+
+    Snapshot is written to a temporary file and renamed into place.
+    """
+    position = data.position
+    stat = os.stat(csv_path)
+    if stat.st_ino != position.inode or stat.st_size != position.offset:
+        log.debug('%s changed while reading, snapshot skipped', csv_path)
+        return
+
+    path = snapshot_path(csv_path)
+    with replacing(path) as tmp_path:
+        with open(tmp_path, 'wb') as target:
+            target.write(HEADER.pack(
+                MAGIC,
+                VERSION,
+                position.offset,
+                stat.st_mtime,
+                position.inode,
+                position.rows,
+                file_hash(csv_path, position.offset),
+                len(data),
+                len(position.last_line),
+            ))
+            target.write(position.last_line)
+            for user_id, items in data.iteritems():
+                target.write(USER.pack(user_id, len(items)))
+                for values in (items.dates, items.starts, items.ends):
+                    if sys.byteorder != 'little':  # pragma: no cover
+                        values = array('i', values)
+                        values.byteswap()
+                    target.write(values.tostring())
+                stats = data.weekday_table[user_id]
+                target.write(STATS.pack(
+                    *(stats.counts + stats.totals + stats.starts + stats.ends)
+                ))
+
+
+def load(csv_path):
+    """
+    Reads PresenceStore from snapshot of ``csv_path``.
+
+    Returns None when there is no snapshot, or it is stale or broken.
+    """
+    path = snapshot_path(csv_path)
+    try:
+        with open(path, 'rb') as source:
+            buf = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        return read(buf, csv_path)
+    except (struct.error, ValueError):
+        log.warning('Broken presence data snapshot %s', path)
+        return None
+    finally:
+        buf.close()
+
+
+def read(buf, csv_path):
+    """
+    Reads PresenceStore from snapshot buffer if it matches the CSV file.
+    """
+    (magic, version, size, mtime, inode, rows, digest, users,
+     last_line_size) = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        return None
+    stat = os.stat(csv_path)
+    if stat.st_size != size:
+        return None
+    if ((stat.st_mtime, stat.st_ino) != (mtime, inode) and
+            file_hash(csv_path, size) != digest):
+        return None
+
+    offset = HEADER.size + last_line_size
+    data = PresenceStore()
+    data.position = CsvPosition(
+        stat.st_ino,
+        size,
+        rows,
+        buf[HEADER.size:offset],
+    )
+    for _ in xrange(users):
+        user_id, count = USER.unpack_from(buf, offset)
+        offset += USER.size
+        items = UserPresence()
+        for values in (items.dates, items.starts, items.ends):
+            values.fromstring(buf[offset:offset + count * values.itemsize])
+            if sys.byteorder != 'little':  # pragma: no cover
+                values.byteswap()
+            offset += count * values.itemsize
+        stats = list(STATS.unpack_from(buf, offset))
+        offset += STATS.size
+        data[user_id] = items
+        data.weekday_table[user_id] = WeekdayStats(
+            stats[0:7], stats[7:14], stats[14:21], stats[21:28]
+        )
+    data.rollups = build_rollups(data.weekday_table)
+    return data
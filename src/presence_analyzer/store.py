@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, array-backed storage of presence data.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Mapping, namedtuple
+from datetime import date, time
+from itertools import izip
+
+# 7-element lists indexed by weekday: number of entries, total presence,
+# sum of starts and sum of ends, all in seconds
+WeekdayStats = namedtuple('WeekdayStats', 'counts totals starts ends')
+
+# how much of presence CSV file was read: file inode, byte offset after
+# last line, number of rows and the last line itself
+CsvPosition = namedtuple('CsvPosition', 'inode offset rows last_line')
+
+
+def sum_weekday_entries(entries):
+    """
+    Sums (weekday, start, end) entries into WeekdayStats.
+    """
+    counts = [0] * 7
+    totals = [0] * 7
+    starts = [0] * 7
+    ends = [0] * 7
+    for weekday, start, end in entries:
+        counts[weekday] += 1
+        totals[weekday] += end - start
+        starts[weekday] += start
+        ends[weekday] += end
+    return WeekdayStats(counts, totals, starts, ends)
+
+
+def seconds_to_clock(seconds):
+    """
+    Converts number of seconds since midnight into datetime.time.
+    """
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return time(hours, minutes, seconds)
+
+
+class UserPresence(Mapping):
+    """
+    Presence entries of a single user.
+
+    Entries are kept in three parallel arrays sorted by date: date ordinals
+    and start/end times as seconds since midnight. For backward
+    compatibility it is also a read-only mapping of datetime.date to
+    {'start': datetime.time, 'end': datetime.time} dictionaries, built on
+    access.
+    """
+
+    def __init__(self):
+        self.dates = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+
+    def add(self, ordinal, start, end):
+        """
+        Stores entry keeping dates sorted, later entries win on same date.
+        """
+        dates = self.dates
+        if not dates or ordinal > dates[-1]:
+            dates.append(ordinal)
+            self.starts.append(start)
+            self.ends.append(end)
+            return
+
+        index = bisect_left(dates, ordinal)
+        if dates[index] == ordinal:
+            self.starts[index] = start
+            self.ends[index] = end
+        else:
+            dates.insert(index, ordinal)
+            self.starts.insert(index, start)
+            self.ends.insert(index, end)
+
+    @classmethod
+    def from_strings(cls, dates, starts, ends):
+        """
+        Creates UserPresence from machine values of its arrays.
+        """
+        user = cls()
+        user.dates.fromstring(dates)
+        user.starts.fromstring(starts)
+        user.ends.fromstring(ends)
+        return user
+
+    def to_strings(self):
+        """
+        Returns arrays as machine values, cheap to pickle.
+        """
+        return (
+            self.dates.tostring(),
+            self.starts.tostring(),
+            self.ends.tostring(),
+        )
+
+    def extend(self, other):
+        """
+        Adds all entries of other UserPresence, they win on same dates.
+        """
+        if not other.dates:
+            return
+        if not self.dates or other.dates[0] > self.dates[-1]:
+            self.dates.extend(other.dates)
+            self.starts.extend(other.starts)
+            self.ends.extend(other.ends)
+            return
+        for entry in izip(other.dates, other.starts, other.ends):
+            self.add(*entry)
+
+    def copy(self):
+        """
+        Returns independent copy of this object.
+        """
+        user = UserPresence()
+        user.dates = array('i', self.dates)
+        user.starts = array('i', self.starts)
+        user.ends = array('i', self.ends)
+        return user
+
+    def bounds(self, first=None, last=None):
+        """
+        Returns (start, stop) indexes of entries between two date ordinals.
+
+        Both ends are inclusive, None means open end.
+        """
+        start = 0 if first is None else bisect_left(self.dates, first)
+        stop = (
+            len(self.dates) if last is None
+            else bisect_right(self.dates, last)
+        )
+        return start, max(start, stop)
+
+    def count_between(self, first=None, last=None):
+        """
+        Returns number of entries between two date ordinals.
+        """
+        start, stop = self.bounds(first, last)
+        return stop - start
+
+    def between(self, first=None, last=None):
+        """
+        Returns UserPresence with entries between two date ordinals.
+        """
+        start, stop = self.bounds(first, last)
+        user = UserPresence()
+        user.dates = self.dates[start:stop]
+        user.starts = self.starts[start:stop]
+        user.ends = self.ends[start:stop]
+        return user
+
+    def weekday_entries(self):
+        """
+        Yields (weekday, start, end) tuples, times as seconds since midnight.
+        """
+        # date.fromordinal(1) is Monday
+        for ordinal, start, end in izip(self.dates, self.starts, self.ends):
+            yield (ordinal + 6) % 7, start, end
+
+    def __getitem__(self, day):
+        ordinal = day.toordinal()
+        index = bisect_left(self.dates, ordinal)
+        if index == len(self.dates) or self.dates[index] != ordinal:
+            raise KeyError(day)
+        return {
+            'start': seconds_to_clock(self.starts[index]),
+            'end': seconds_to_clock(self.ends[index]),
+        }
+
+    def __iter__(self):
+        return (date.fromordinal(ordinal) for ordinal in self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, day):
+        try:
+            ordinal = day.toordinal()
+        except AttributeError:
+            return False
+        index = bisect_left(self.dates, ordinal)
+        return index < len(self.dates) and self.dates[index] == ordinal
+
+    def __eq__(self, other):
+        if isinstance(other, UserPresence):
+            return (
+                self.dates == other.dates and
+                self.starts == other.starts and
+                self.ends == other.ends
+            )
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<UserPresence: {} entries>'.format(len(self))
+
+
+class PresenceStore(dict):
+    """
+    Presence data grouped by user_id, values are UserPresence objects.
+
+    ``weekday_table`` maps user_id to WeekdayStats and ``rollups`` keeps
+    company-wide Rollups, both are filled by the loader once all entries
+    are added. ``position`` tells the loader how much of the source file
+    was read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PresenceStore, self).__init__(*args, **kwargs)
+        self.weekday_table = {}
+        self.rollups = None
+        self.position = None
+
+    def add(self, user_id, ordinal, start, end):
+        """
+        Stores single presence entry of given user.
+        """
+        user = self.get(user_id)
+        if user is None:
+            user = self[user_id] = UserPresence()
+        user.add(ordinal, start, end)
+
+    def merged(self, other):
+        """
+        Returns new store with entries of ``other`` store added.
+
+        Entries of ``other`` win on the same dates. This store is left
+        untouched, only users present in ``other`` are copied.
+        """
+        store = PresenceStore(self)
+        store.weekday_table = dict(self.weekday_table)
+        store.position = self.position
+        for user_id, items in other.iteritems():
+            user = self.get(user_id)
+            user = user.copy() if user is not None else UserPresence()
+            user.extend(items)
+            store[user_id] = user
+        return store
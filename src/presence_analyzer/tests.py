@@ -2,16 +2,41 @@
 """
 Presence analyzer unit tests.
 """
+import BaseHTTPServer
 import datetime
 import json
+import logging
 from lxml import etree
 import os.path
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import zlib
+from werkzeug.serving import make_server
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
 from presence_analyzer import (  # pylint: disable=unused-import
+    compression,
+    cron,
+    database,
+    engine,
+    files,
+    loadtest,
     main,
+    metrics,
+    profiling,
+    refresh,
+    rollups,
+    serializers,
+    shared,
+    snapshot,
+    store,
     utils,
     views,
 )
+from presence_analyzer.config import BASE_XML_FILE, TEST_XML_FILE
 from presence_analyzer.main import app
 from presence_analyzer.utils import jsonify
 
@@ -28,6 +53,33 @@ TEST_EMPTY_DATA_CSV = os.path.join(
 )
 
 
+# API responses which have to be the same whatever way data is loaded
+BACKEND_URLS = [
+    '/api/v1/users',
+    '/api/v1/users?from=2013-09-11',
+    '/api/v1/mean_time_weekday/10',
+    '/api/v1/presence_weekday/11',
+    '/api/v1/presence_start_end/11?to=2013-09-10',
+    '/api/v1/bulk',
+    '/api/v1/rollup/presence_start_end',
+    '/api/v1/top/end?order=asc',
+]
+
+
+def copy_test_data(test_case):
+    """
+    Copy test data file into temporary directory and use it as DATA_CSV.
+
+    Return path of the copy, the directory is removed after the test.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, tmp_dir)
+    tmp_csv = os.path.join(tmp_dir, 'data.csv')
+    shutil.copy(TEST_DATA_CSV, tmp_csv)
+    main.app.config.update({'DATA_CSV': tmp_csv})
+    return tmp_csv
+
+
 # pylint: disable=maybe-no-member, too-many-public-methods
 class PresenceAnalyzerViewsTestCase(unittest.TestCase):
     """
@@ -65,6 +117,417 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         self.assertEqual(len(data), 2)
         self.assertDictEqual(data[0], {u'user_id': 10, u'name': u'Maciej Z.'})
 
+    def test_api_users_not_in_xml(self):
+        """
+        Test users listing for users missing in XML file.
+        """
+        main.app.config.update({'USERS_XML': TEST_XML_FILE})
+        try:
+            resp = self.client.get('/api/v1/users')
+        finally:
+            main.app.config.update({'USERS_XML': BASE_XML_FILE})
+        data = json.loads(resp.data)
+        self.assertItemsEqual(
+            data,
+            [
+                {u'user_id': 10, u'name': u'User 10'},
+                {u'user_id': 11, u'name': u'User 11'},
+            ]
+        )
+
+    def test_api_conditional_etag(self):
+        """
+        Test API responses can be revalidated with ETag.
+        """
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, '')
+        self.assertEqual(resp.headers['ETag'], etag)
+
+        # other user, other ETag
+        resp = self.client.get(
+            '/api/v1/presence_weekday/11', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+        # other data, other ETag
+        main.app.config.update({'DATA_CSV': TEST_WRONG_DATA_CSV})
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_conditional_last_modified(self):
+        """
+        Test API responses can be revalidated with Last-Modified.
+        """
+        resp = self.client.get('/api/v1/users')
+        self.assertEqual(resp.status_code, 200)
+        last_modified = resp.headers['Last-Modified']
+
+        resp = self.client.get(
+            '/api/v1/users', headers={'If-Modified-Since': last_modified}
+        )
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(
+            '/api/v1/users',
+            headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_conditional_not_found(self):
+        """
+        Test revalidation of missing resources and wrong arguments fails.
+        """
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        headers = {'If-Modified-Since': resp.headers['Last-Modified']}
+
+        resp = self.client.get(
+            '/api/v1/presence_weekday/424242', headers=headers
+        )
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10?from=wrong', headers=headers
+        )
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.get('/api/v1/presence_weekday/10', headers=headers)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_api_response_cache(self):
+        """
+        Test serialized API responses are cached until data reloads.
+        """
+        utils.response_cache.clear()
+        hits, misses = utils.response_cache.hits, utils.response_cache.misses
+        first = self.client.get('/api/v1/mean_time_weekday/10').data
+        second = self.client.get('/api/v1/mean_time_weekday/10').data
+        self.assertEqual(first, second)
+        self.client.get('/api/v1/mean_time_weekday/11')
+        self.assertEqual(utils.response_cache.hits - hits, 1)
+        self.assertEqual(utils.response_cache.misses - misses, 2)
+        self.assertEqual(len(utils.response_cache.entries), 2)
+
+        utils.get_data.invalidate()
+        self.assertEqual(len(utils.response_cache.entries), 0)
+        self.assertEqual(utils.response_cache.size, 0)
+
+    def test_api_metrics(self):
+        """
+        Test timings in Server-Timing header and metrics endpoint.
+        """
+        resp = self.client.get('/api/v1/_metrics')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get('/api/v1/users')
+        self.assertNotIn('Server-Timing', resp.headers)
+
+        main.app.config.update({'METRICS': True})
+        self.addCleanup(main.app.config.update, {'METRICS': False})
+        utils.get_data.invalidate()
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        timings = [
+            timing.split(';')[0]
+            for timing in resp.headers['Server-Timing'].split(', ')
+        ]
+        self.assertEqual(
+            timings, ['get_data', 'select_stats', 'jsonify', 'total']
+        )
+
+        resp = self.client.get('/api/v1/_metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.content_type, 'text/plain; version=0.0.4; charset=utf-8'
+        )
+        lines = resp.data.splitlines()
+        self.assertIn(
+            '# TYPE presence_analyzer_section_seconds histogram', lines
+        )
+        self.assertIn(
+            'presence_analyzer_section_seconds_bucket'
+            '{section="get_data",le="+Inf"} 1',
+            lines
+        )
+        self.assertIn(
+            'presence_analyzer_request_seconds_count'
+            '{endpoint="presence_weekday_view"} 1',
+            lines
+        )
+        self.assertIn(
+            '# TYPE presence_analyzer_response_cache_hits_total counter', lines
+        )
+
+    def test_profiler_middleware(self):
+        """
+        Test profiling of triggered requests and profiles index.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        middleware = profiling.ProfilerMiddleware(
+            main.app.wsgi_app, tmp_dir, url_map=main.app.url_map, keep=2
+        )
+        client = Client(middleware, BaseResponse)
+
+        resp = client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(os.listdir(tmp_dir), [])
+
+        resp = client.get(
+            '/api/v1/presence_weekday/10', headers={'X-Profile': '1'}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            json.loads(resp.data)[0], ['Weekday', 'Presence (s)']
+        )
+        names = os.listdir(tmp_dir)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('presence_weekday_view.'))
+        self.assertTrue(names[0].endswith('.prof'))
+
+        middleware.sample_rate = 1.0
+        client.get('/api/v1/users')
+        client.get('/no/such/page')
+        self.assertEqual(len(os.listdir(tmp_dir)), 2)
+        self.assertTrue(middleware.profiles()[0].startswith('no_such_page.'))
+
+        resp = client.get('/_profiles')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('no_such_page.', resp.data)
+        self.assertIn('<td>', resp.data)
+
+    def test_api_streamed_list(self):
+        """
+        Test long lists are streamed and cached once sent.
+        """
+        utils.response_cache.clear()
+        expected = self.client.get('/api/v1/users').data
+        utils.response_cache.clear()
+        main.app.config.update({'JSON_CHUNK_ITEMS': 1})
+        self.addCleanup(main.app.config.update, {'JSON_CHUNK_ITEMS': 1000})
+
+        resp = self.client.get('/api/v1/users')
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertEqual(resp.data, expected)
+        hits = utils.response_cache.hits
+        resp = self.client.get('/api/v1/users')
+        self.assertEqual(utils.response_cache.hits - hits, 1)
+        self.assertEqual(resp.data, expected)
+
+    def test_compression(self):
+        """
+        Test negotiated gzip compression and cache of compressed bodies.
+        """
+        plain = self.client.get('/api/v1/users').data
+        main.app.config.update({'COMPRESSION': True})
+        self.addCleanup(main.app.config.update, {'COMPRESSION': False})
+        main.app.config.update({'COMPRESSION_MIN_SIZE': 10})
+        self.addCleanup(
+            main.app.config.update, {'COMPRESSION_MIN_SIZE': 500}
+        )
+        compression.compressed_cache.clear()
+        gzip = {'Accept-Encoding': 'gzip, deflate'}
+
+        resp = self.client.get('/api/v1/users')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, plain)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+        etag = resp.headers['ETag']
+        resp = self.client.get('/api/v1/users', headers=gzip)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(resp.data, 31), plain)
+        self.assertEqual(
+            int(resp.headers['Content-Length']), len(resp.data)
+        )
+        self.assertEqual(resp.headers['ETag'], etag[:-1] + '-gzip"')
+
+        # compressed response is revalidated with its own ETag
+        resp = self.client.get('/api/v1/users', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': resp.headers['ETag'],
+        })
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag[:-1] + '-gzip"')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        resp = self.client.get(
+            '/api/v1/users', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+
+        # streamed response
+        resp = self.client.get('/api/v1/bulk', headers=gzip)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(zlib.decompress(resp.data, 31)),
+            json.loads(self.client.get('/api/v1/bulk').data)
+        )
+
+        # static file is compressed once per version
+        with main.app.open_resource('static/js/jquery.min.js') as jsfile:
+            script = jsfile.read()
+        hits = compression.compressed_cache.hits
+        for _ in range(2):
+            resp = self.client.get('/static/js/jquery.min.js', headers=gzip)
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(zlib.decompress(resp.data, 31), script)
+        self.assertEqual(compression.compressed_cache.hits - hits, 1)
+
+        # reload of data keeps compressed static files
+        utils.get_data.invalidate()
+        utils.get_data()
+        resp = self.client.get('/static/js/jquery.min.js', headers=gzip)
+        self.assertEqual(compression.compressed_cache.hits - hits, 2)
+
+        # small responses are sent as they are
+        main.app.config.update({'COMPRESSION_MIN_SIZE': len(plain) + 1})
+        resp = self.client.get('/api/v1/users', headers=gzip)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, plain)
+
+    def test_api_rollup(self):
+        """
+        Test weekday metrics of all users and of a group.
+        """
+        resp = self.client.get('/api/v1/rollup/presence_weekday')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        self.assertEqual(json.loads(resp.data), [
+            ['Weekday', 'Presence (s)'], ['Mon', 24123], ['Tue', 46611],
+            ['Wed', 49786], ['Thu', 69673], ['Fri', 6426], ['Sat', 0],
+            ['Sun', 0],
+        ])
+
+        # group of users, unknown ones are skipped
+        resp = self.client.get('/api/v1/rollup/mean_time_weekday?users=10,99')
+        self.assertEqual(
+            resp.data, self.client.get('/api/v1/mean_time_weekday/10').data
+        )
+        resp = self.client.get(
+            '/api/v1/rollup/presence_start_end?from=2013-09-10&to=2013-09-10'
+        )
+        self.assertEqual(json.loads(resp.data), [
+            ['Tue', '0001-01-01 09:29:27', '0001-01-01 15:57:53'],
+        ])
+
+        resp = self.client.get('/api/v1/rollup/unknown')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get('/api/v1/rollup/presence_weekday?users=a')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_api_top(self):
+        """
+        Test rankings of users.
+        """
+        resp = self.client.get('/api/v1/top/presence')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual([user['user_id'] for user in data], [10, 11])
+        self.assertEqual(data[0]['name'], 'Maciej Z.')
+        self.assertAlmostEqual(data[0]['value'], 78217 / 3.0)
+
+        resp = self.client.get('/api/v1/top/days?n=1&order=asc')
+        self.assertEqual(json.loads(resp.data), [
+            {'user_id': 10, 'name': 'Maciej Z.', 'value': 3},
+        ])
+        resp = self.client.get('/api/v1/top/days?from=2013-09-10')
+        self.assertEqual(
+            [(user['user_id'], user['value']) for user in json.loads(
+                resp.data
+            )],
+            [(11, 4), (10, 3)]
+        )
+
+        resp = self.client.get('/api/v1/top/unknown')
+        self.assertEqual(resp.status_code, 404)
+        for query in ('n=0', 'n=a', 'order=up'):
+            resp = self.client.get('/api/v1/top/days?' + query)
+            self.assertEqual(resp.status_code, 400)
+
+    def test_api_bulk(self):
+        """
+        Test weekday metrics of many users at once.
+        """
+        resp = self.client.get('/api/v1/bulk')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertItemsEqual([item['user_id'] for item in data], [10, 11])
+        for item in data:
+            for metric in (
+                    'mean_time_weekday',
+                    'presence_weekday',
+                    'presence_start_end',
+            ):
+                resp = self.client.get(
+                    '/api/v1/{}/{}'.format(metric, item['user_id'])
+                )
+                self.assertEqual(item[metric], json.loads(resp.data))
+
+        resp = self.client.get(
+            '/api/v1/bulk?users=11,999&metrics=presence_weekday'
+        )
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 1)
+        self.assertItemsEqual(data[0].keys(), ['user_id', 'presence_weekday'])
+
+        resp = self.client.get('/api/v1/bulk?users=999')
+        self.assertEqual(json.loads(resp.data), [])
+
+    def test_api_bulk_wrong_arguments(self):
+        """
+        Test bulk view with wrong arguments.
+        """
+        resp = self.client.get('/api/v1/bulk?users=10,some-text')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get('/api/v1/bulk?metrics=presence_weekday,xxx')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_api_date_range(self):
+        """
+        Test API views limited to date range.
+        """
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10?from=2013-09-11&to=2013-09-11'
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[2], [u'Tue', 0])
+        self.assertEqual(data[3], [u'Wed', 24465])
+        self.assertEqual(data[4], [u'Thu', 0])
+
+        resp = self.client.get('/api/v1/mean_time_weekday/10?from=2013-09-11')
+        data = json.loads(resp.data)
+        self.assertEqual(data[1], [u'Tue', 0])
+        self.assertEqual(data[3], [u'Thu', 23705.0])
+
+        resp = self.client.get('/api/v1/presence_start_end/10?to=2013-09-10')
+        self.assertEqual(
+            json.loads(resp.data),
+            [[u'Tue', u'0001-01-01 09:39:05', u'0001-01-01 17:59:52']]
+        )
+
+        resp = self.client.get('/api/v1/users?from=2013-09-13')
+        self.assertEqual(
+            [item['user_id'] for item in json.loads(resp.data)], [11]
+        )
+
+        resp = self.client.get('/api/v1/bulk?from=2014-01-01')
+        for item in json.loads(resp.data):
+            self.assertEqual(item['presence_start_end'], [])
+
+        resp = self.client.get('/api/v1/presence_weekday/10?from=2013-13-01')
+        self.assertEqual(resp.status_code, 400)
+
     def test_start_end_presence_correct(self):
         """
         Test average user presence by weekday - correct data.
@@ -262,6 +725,66 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         self.assertEqual(jsonified.status_code, 200)
         self.assertEqual(jsonified.content_type, 'application/json')
 
+    def test_response_cache_limits(self):
+        """
+        Test least recently used responses are evicted over the limits.
+        """
+        cache = utils.ResponseCache()
+        main.app.config.update({
+            'RESPONSE_CACHE_ENTRIES': 2,
+            'RESPONSE_CACHE_BYTES': 10,
+        })
+        try:
+            cache.put('a', '1234')
+            cache.put('b', '1234')
+            self.assertEqual(cache.get('a'), '1234')
+            cache.put('c', '1234')
+            self.assertEqual(cache.entries.keys(), ['a', 'c'])
+            cache.put('d', '12345678')
+            self.assertEqual(cache.entries.keys(), ['d'])
+            self.assertEqual(cache.size, 8)
+            cache.put('e', '12345678901')
+            self.assertIsNone(cache.get('e'))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+        finally:
+            main.app.config.update({
+                'RESPONSE_CACHE_ENTRIES': 1024,
+                'RESPONSE_CACHE_BYTES': 16 * 1024 * 1024,
+            })
+
+    def test_histogram(self):
+        """
+        Test cumulative histogram buckets.
+        """
+        histogram = metrics.Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(
+            histogram.samples(),
+            ([(0.1, 2), (1.0, 3), ('+Inf', 4)], 4, 2.65)
+        )
+
+    def test_serializers(self):
+        """
+        Test JSON serializers and chunked serialization.
+        """
+        value = [
+            ('Mon', 1.0 / 3), ['a/b', None], {'user_id': 1, 'name': u'\u0105'}
+        ]
+        self.addCleanup(main.app.config.update, {'JSON_SERIALIZER': 'json'})
+        for name in ['json', 'missing'] + serializers.SERIALIZERS.keys():
+            main.app.config.update({'JSON_SERIALIZER': name})
+            body = serializers.dumps(value)
+            if name in ('json', 'missing'):
+                self.assertEqual(body, json.dumps(value))
+            self.assertEqual(json.loads(body)[2], value[2])
+            for chunk_items in (1, 2, 3, 4):
+                self.assertEqual(
+                    ''.join(serializers.dumps_chunks(value, chunk_items)),
+                    body
+                )
+            self.assertEqual(''.join(serializers.dumps_chunks([], 1)), '[]')
+
     def test_get_data(self):
         """
         Test parsing of CSV file.
@@ -375,6 +898,144 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         end = datetime.time(10, 45)
         self.assertEqual(utils.interval(start, end), - 14400)  # -4 hours
 
+    def test_update_data(self):
+        """
+        Test reading lines appended to data file.
+        """
+        tmp_csv = copy_test_data(self)
+
+        data = utils.get_data()
+        self.assertEqual(data.position.rows, 9)
+        self.assertEqual(
+            data.position.last_line, '11,2013-09-13,13:16:56,15:04:02\r\n'
+        )
+        with open(tmp_csv, 'a') as csvfile:
+            csvfile.write(
+                '10,2013-09-10,08:00:00,16:00:00\n'
+                '12,2013-09-12,10:48:46,17:23:51\n'
+                '12,2013-09-13,10:'
+            )
+        updated = utils.update_data(data)
+        self.assertEqual(updated.position.rows, 11)
+        self.assertEqual(
+            updated.position.offset,
+            os.path.getsize(tmp_csv) - len('12,2013-09-13,10:')
+        )
+        self.assertIs(updated[11], data[11])
+        self.assertEqual(len(updated[12]), 1)
+        self.assertEqual(
+            updated[10][datetime.date(2013, 9, 10)]['start'],
+            datetime.time(8, 0, 0)
+        )
+        self.assertEqual(
+            data[10][datetime.date(2013, 9, 10)]['start'],
+            datetime.time(9, 39, 5)
+        )
+        self.assertEqual(
+            updated.weekday_table, utils.get_data.function().weekday_table
+        )
+
+        # incomplete line is read once it is finished
+        with open(tmp_csv, 'a') as csvfile:
+            csvfile.write('48:46,17:23:51\n')
+        updated = utils.update_data(updated)
+        self.assertEqual(len(updated[12]), 2)
+        self.assertEqual(updated, utils.get_data.function())
+        self.assertEqual(utils.get_data(), updated)
+
+    def test_update_data_full_reload(self):
+        """
+        Test data file is read again when it was truncated or replaced.
+        """
+        tmp_csv = copy_test_data(self)
+        data = utils.get_data()
+
+        # truncated
+        with open(tmp_csv, 'w') as csvfile:
+            csvfile.write('12,2013-09-12,10:48:46,17:23:51\n')
+        self.assertIsNone(utils.update_data(data))
+        self.assertItemsEqual(utils.get_data().keys(), [12])
+
+        # rewritten in place
+        shutil.copy(TEST_DATA_CSV, tmp_csv)
+        data = utils.get_data()
+        with open(tmp_csv, 'r+') as csvfile:
+            csvfile.seek(-10, os.SEEK_END)
+            csvfile.write('16:04:02\r\n')
+            csvfile.write('12,2013-09-13,10:48:46,17:23:51\n')
+        self.assertIsNone(utils.update_data(data))
+
+        # replaced with other file
+        shutil.copy(TEST_DATA_CSV, tmp_csv)
+        data = utils.get_data()
+        shutil.copy(TEST_WRONG_DATA_CSV, tmp_csv + '.new')
+        with open(tmp_csv + '.new', 'a') as csvfile:
+            csvfile.write('12,2013-09-13,10:48:46,17:23:51\n')
+        os.rename(tmp_csv + '.new', tmp_csv)
+        self.assertIsNone(utils.update_data(data))
+
+    def test_split_file(self):
+        """
+        Test splitting file into chunks ending at line ends.
+        """
+        with open(TEST_DATA_CSV, 'rb') as csvfile:
+            content = csvfile.read()
+            chunks = utils.split_file(csvfile, len(content), 4)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(content))
+        for (_, stop), (start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(stop, start)
+            self.assertEqual(content[stop - 1], '\n')
+
+    def test_read_data_parallel(self):
+        """
+        Test parsing file in process pool gives the same data.
+        """
+        tmp_csv = copy_test_data(self)
+        with open(tmp_csv, 'a') as csvfile:
+            # later rows win on duplicate dates
+            csvfile.write('10,2013-09-10,08:00:00,16:00:00\n')
+
+        data = utils.read_data(tmp_csv, workers=1)
+        for workers in (2, 3, 20):
+            parallel = utils.read_data(tmp_csv, workers=workers)
+            self.assertEqual(parallel, data)
+            self.assertEqual(parallel.weekday_table, data.weekday_table)
+            self.assertEqual(parallel.position, data.position)
+        self.assertEqual(
+            data[10][datetime.date(2013, 9, 10)]['start'],
+            datetime.time(8, 0, 0)
+        )
+
+    def test_parse_date(self):
+        """
+        Test fast-path date parser.
+        """
+        self.assertEqual(
+            utils.parse_date('2013-09-10'),
+            datetime.date(2013, 9, 10)
+        )
+        # not zero padded values fall back to strptime
+        self.assertEqual(
+            utils.parse_date('2013-9-1'),
+            datetime.date(2013, 9, 1)
+        )
+        for value in ('True', '2013-02-30', '2013-+9-10', ' 013-09-10', ''):
+            self.assertRaises(ValueError, utils.parse_date, value)
+
+    def test_parse_time(self):
+        """
+        Test fast-path time parser.
+        """
+        self.assertEqual(
+            utils.parse_time('09:39:05'),
+            datetime.time(9, 39, 5)
+        )
+        self.assertEqual(utils.parse_time('9:39:5'), datetime.time(9, 39, 5))
+        for value in ('24:00:00', '10:60:00', '10:-1:00', 'xx:yy:zz', ''):
+            self.assertRaises(ValueError, utils.parse_time, value)
+
     def test_mean(self):
         """
         Test mean.
@@ -410,6 +1071,24 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
             """
         )
 
+    def test_get_users(self):
+        """
+        Test parsing of users XML file.
+        """
+        main.app.config.update({'USERS_XML': TEST_XML_FILE})
+        try:
+            users = utils.get_users()
+            self.assertIs(utils.get_users(), users)
+        finally:
+            main.app.config.update({'USERS_XML': BASE_XML_FILE})
+        self.assertEqual(
+            users,
+            {
+                141: utils.User('Adam P.', '/api/images/users/141'),
+                176: utils.User('Adrian K.', '/api/images/users/176'),
+            }
+        )
+
     def test_update_users_source(self):
         """
         Check if remote XML exists and content type is XML.
@@ -423,11 +1102,816 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
             msg="Wrong XML returned."
         )
 
+    def test_update_users_source_download(self):
+        """
+        Test conditional download of users XML from local server.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'users.xml')
+        with open(TEST_XML_FILE) as xmlfile:
+            content = xmlfile.read()
+        requests = []
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            """
+            Serves users XML with ETag, or broken XML on /broken.
+            """
+            def do_GET(self):  # pylint: disable=invalid-name
+                """
+                Answers GET request.
+                """
+                requests.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = content if self.path == '/' else '<intranet><users>'
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+        app.config.update({'USERS_XML': path})
+        self.addCleanup(app.config.update, {'USERS_XML': BASE_XML_FILE})
+        self.assertTrue(cron.update_users_source(url, path))
+        self.assertNotIn('if-none-match', requests[-1])
+        self.assertEqual(files.file_mode(path), 0666 & ~files.UMASK)
+        with open(path) as xmlfile:
+            self.assertEqual(xmlfile.read(), content)
+        self.assertEqual(utils.get_users()[141].name, 'Adam P.')
+
+        # fresh file is not downloaded again
+        self.assertFalse(cron.update_users_source(url, path))
+        self.assertEqual(len(requests), 1)
+
+        # not modified file is left alone, only the check is recorded
+        old = time.time() - 2 * cron.DAY_IN_SECONDS
+        os.utime(path, (old, old))
+        mtime = os.path.getmtime(path)
+        self.assertFalse(cron.update_users_source(url, path))
+        self.assertEqual(requests[-1]['if-none-match'], '"v1"')
+        self.assertIn('if-modified-since', requests[-1])
+        self.assertEqual(os.path.getmtime(path), mtime)
+        self.assertTrue(cron.is_file_younger_than_one_day(path))
+        self.assertFalse(cron.update_users_source(url, path))
+        self.assertEqual(len(requests), 2)
+
+        # broken download keeps previous file
+        os.utime(cron.checked_path(path), (old, old))
+        os.remove(cron.etag_path(path))
+        with self.assertRaises(etree.XMLSyntaxError):
+            cron.update_users_source(url + 'broken', path)
+        with open(path) as xmlfile:
+            self.assertEqual(xmlfile.read(), content)
+        self.assertItemsEqual(
+            os.listdir(tmp_dir), ['users.xml', 'users.xml.checked']
+        )
+
+    def test_replacing(self):
+        """
+        Test file is replaced keeping its permissions.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'data.txt')
+
+        with files.replacing(path) as tmp_path:
+            with open(tmp_path, 'w') as target:
+                target.write('new')
+        self.assertEqual(files.file_mode(path), 0666 & ~files.UMASK)
+
+        os.chmod(path, 0640)
+        with files.replacing(path) as tmp_path:
+            with open(tmp_path, 'w') as target:
+                target.write('newer')
+        self.assertEqual(files.file_mode(path), 0640)
+
+        with self.assertRaises(ValueError):
+            with files.replacing(path) as tmp_path:
+                raise ValueError(tmp_path)
+        self.assertEqual(os.listdir(tmp_dir), ['data.txt'])
+        with open(path) as source:
+            self.assertEqual(source.read(), 'newer')
+
     def test_cache_method(self):
         """
         Test if cache decorator return valid cache.
         """
-        pass
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        self.assertEqual(utils.get_data.version[0], TEST_DATA_CSV)
+
+        # explicit invalidation
+        utils.get_data.invalidate()
+        self.assertIsNone(utils.get_data.version)
+        self.assertIsNot(utils.get_data(), data)
+        self.assertEqual(utils.get_data(), data)
+
+        # other file gives other data
+        app.config.update({'DATA_CSV': TEST_WRONG_DATA_CSV})
+        self.assertEqual(len(utils.get_data()[11]), 5)
+        app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        self.assertEqual(len(utils.get_data()[11]), 6)
+
+    def test_cache_method_file_changed(self):
+        """
+        Test if cache is rebuilt when data file changes.
+        """
+        tmp_csv = copy_test_data(self)
+
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        with open(tmp_csv, 'a') as csvfile:
+            csvfile.write('12,2013-09-12,10:48:46,17:23:51\n')
+        self.assertNotIn(12, data)
+        self.assertIn(12, utils.get_data())
+
+    def test_cache_refresh(self):
+        """
+        Test background mode serves last value until it is refreshed.
+        """
+        tmp_csv = copy_test_data(self)
+        data = utils.get_data()
+        self.assertFalse(utils.get_data.refresh())
+
+        utils.get_data.background = True
+        self.addCleanup(setattr, utils.get_data, 'background', False)
+        with open(tmp_csv, 'a') as csvfile:
+            csvfile.write('12,2013-09-12,10:48:46,17:23:51\n')
+        self.assertIs(utils.get_data(), data)
+        self.assertTrue(utils.get_data.refresh())
+        refreshed = utils.get_data()
+        self.assertIn(12, refreshed)
+
+        # failed reload keeps previous value
+        os.remove(tmp_csv)
+        self.assertFalse(utils.get_data.refresh())
+        self.assertIs(utils.get_data(), refreshed)
+
+        # other file is loaded on call
+        app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        self.assertNotIn(12, utils.get_data())
+
+    def test_refresher(self):
+        """
+        Test refresher thread reloads changed data file.
+        """
+        tmp_csv = copy_test_data(self)
+        app.config.update({'REFRESH_INTERVAL': 0})
+        self.assertIsNone(refresh.start_refresher())
+
+        refresher = refresh.start_refresher(0.01)
+        self.addCleanup(refresh.stop_refresher)
+        self.assertIs(refresh.start_refresher(0.01), refresher)
+        self.assertTrue(utils.get_data.background)
+        self.assertTrue(utils.get_users.background)
+        data = utils.get_data()
+        self.assertIsNot(data, None)
+
+        reloaded = threading.Event()
+        utils.get_data.on_reload(reloaded.set)
+        self.addCleanup(utils.get_data.callbacks.remove, reloaded.set)
+        with open(tmp_csv, 'a') as csvfile:
+            csvfile.write('12,2013-09-12,10:48:46,17:23:51\n')
+        self.assertTrue(reloaded.wait(5))
+        self.assertIn(12, utils.get_data())
+
+        refresh.stop_refresher()
+        self.assertFalse(refresher.is_alive())
+        self.assertFalse(utils.get_data.background)
+
+    def test_loadtest_results(self):
+        """
+        Test summary of load test runs and recommended settings.
+        """
+        self.assertEqual(loadtest.percentile([], 0.5), 0)
+        self.assertEqual(loadtest.percentile(range(100), 0.95), 95)
+        self.assertEqual(loadtest.percentile([1, 2], 0.99), 2)
+
+        small = loadtest.Settings(10, 5, 0)
+        result = loadtest.summarize(small, [0.3, 0.1, 0.2], 1, 2.0)
+        self.assertEqual(result.requests, 4)
+        self.assertEqual(result.throughput, 1.5)
+        self.assertEqual(result.error_rate, 0.25)
+        self.assertEqual((result.p50, result.p99), (0.2, 0.3))
+        self.assertIn('25.00%', loadtest.report(result))
+
+        results = [
+            loadtest.Result(small, 100, 90.0, 0, 0.1, 0.2, 0.3),
+            loadtest.Result(
+                loadtest.Settings(25, 5, 0), 100, 100.0, 0, 0.1, 0.2, 0.3
+            ),
+            loadtest.Result(
+                loadtest.Settings(50, 5, 0), 100, 120.0, 0.5, 0.1, 0.2, 0.3
+            ),
+        ]
+        self.assertEqual(loadtest.recommend(results), results[1])
+        self.assertEqual(
+            loadtest.recommend(results, tolerance=0.2), results[0]
+        )
+        self.assertIsNone(loadtest.recommend(results[2:]))
+        self.assertIsNone(loadtest.recommend([
+            loadtest.Result(small, 0, 0.0, 0, 0, 0, 0),
+        ]))
+
+    def test_loadtest_dropped_connections(self):
+        """
+        Test requests dropped by server are counted as errors.
+        """
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            """
+            Closes connection without response.
+            """
+            def do_GET(self):  # pylint: disable=invalid-name
+                """
+                Answers GET request with nothing.
+                """
+                self.close_connection = 1
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        latencies, errors, seconds = loadtest.drive(
+            'http://127.0.0.1:{}'.format(server.server_port), [10], 2, 0.2,
+            timeout=1,
+        )
+        self.assertEqual(latencies, [])
+        self.assertGreater(errors, 0)
+        result = loadtest.summarize(None, latencies, errors, seconds)
+        self.assertEqual(result.error_rate, 1)
+        self.assertIsNone(loadtest.recommend([result]))
+
+    def test_loadtest_run(self):
+        """
+        Test load test serves application in child process and drives it.
+        """
+        app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+        def server_factory(application, settings):
+            """
+            Returns threaded werkzeug server instead of Paste one.
+            """
+            # pylint: disable=unused-argument
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            return make_server('127.0.0.1', 0, application, threaded=True)
+
+        results = loadtest.sweep(
+            lambda: app, [[1, 2], [1], [0]], 2, 0.2,
+            server_factory=server_factory,
+        )
+        self.assertEqual(
+            [result.settings.workers for result in results], [1, 2]
+        )
+        for result in results:
+            self.assertGreater(result.requests, 0)
+            self.assertEqual(result.error_rate, 0)
+            self.assertLessEqual(result.p50, result.p99)
+
+
+class PresenceAnalyzerStoreTestCase(unittest.TestCase):
+    """
+    Presence store tests.
+    """
+
+    def test_user_presence_add(self):
+        """
+        Test entries are kept sorted by date, later entries win.
+        """
+        user = store.UserPresence()
+        day = datetime.date(2013, 9, 10).toordinal()
+        user.add(day, 100, 200)
+        user.add(day - 1, 300, 400)
+        user.add(day + 1, 500, 600)
+        user.add(day, 700, 800)
+        self.assertEqual(list(user.dates), [day - 1, day, day + 1])
+        self.assertEqual(list(user.starts), [300, 700, 500])
+        self.assertEqual(list(user.ends), [400, 800, 600])
+
+    def test_user_presence_mapping(self):
+        """
+        Test UserPresence can be read like {date: {'start':, 'end':}}.
+        """
+        user = store.UserPresence()
+        user.add(datetime.date(2013, 9, 10).toordinal(), 34745, 64792)
+        user.add(datetime.date(2013, 9, 12).toordinal(), 38926, 62631)
+        self.assertEqual(len(user), 2)
+        self.assertEqual(
+            list(user),
+            [datetime.date(2013, 9, 10), datetime.date(2013, 9, 12)]
+        )
+        self.assertEqual(
+            user[datetime.date(2013, 9, 10)],
+            {
+                'start': datetime.time(9, 39, 5),
+                'end': datetime.time(17, 59, 52),
+            }
+        )
+        self.assertIn(datetime.date(2013, 9, 12), user)
+        self.assertNotIn(datetime.date(2013, 9, 11), user)
+        self.assertNotIn(None, user)
+        self.assertRaises(
+            KeyError, user.__getitem__, datetime.date(2014, 1, 1)
+        )
+        self.assertEqual(
+            list(user.weekday_entries()),
+            [(1, 34745, 64792), (3, 38926, 62631)]
+        )
+
+    def test_user_presence_between(self):
+        """
+        Test selecting entries between two dates.
+        """
+        user = store.UserPresence()
+        for day in (10, 12, 14, 16):
+            user.add(day, day, day + 1)
+        self.assertEqual(user.bounds(), (0, 4))
+        self.assertEqual(user.bounds(12, 14), (1, 3))
+        self.assertEqual(user.bounds(11, None), (1, 4))
+        self.assertEqual(user.bounds(13, 13), (2, 2))
+        self.assertEqual(user.bounds(20, 5), (4, 4))
+        self.assertEqual(user.count_between(None, 12), 2)
+        selected = user.between(11, 15)
+        self.assertEqual(list(selected.dates), [12, 14])
+        self.assertEqual(list(selected.starts), [12, 14])
+        self.assertEqual(list(selected.ends), [13, 15])
+
+    def test_presence_store(self):
+        """
+        Test get_data builds PresenceStore equal to plain dictionaries.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        data = utils.get_data()
+        self.assertIsInstance(data, store.PresenceStore)
+        self.assertIsInstance(data[10], store.UserPresence)
+        self.assertEqual(
+            dict(data[10]),
+            {
+                datetime.date(2013, 9, 10): {
+                    'start': datetime.time(9, 39, 5),
+                    'end': datetime.time(17, 59, 52),
+                },
+                datetime.date(2013, 9, 11): {
+                    'start': datetime.time(9, 19, 52),
+                    'end': datetime.time(16, 7, 37),
+                },
+                datetime.date(2013, 9, 12): {
+                    'start': datetime.time(10, 48, 46),
+                    'end': datetime.time(17, 23, 51),
+                },
+            }
+        )
+        self.assertEqual(
+            utils.group_by_weekday(data[10]),
+            utils.group_by_weekday(dict(data[10]))
+        )
+
+    def test_rollups(self):
+        """
+        Test company-wide rollups and rankings.
+        """
+        first = store.WeekdayStats([1] * 7, [10] * 7, [2] * 7, [12] * 7)
+        second = store.WeekdayStats([0] * 7, [0] * 7, [0] * 7, [0] * 7)
+        self.assertEqual(
+            rollups.merge_weekday_stats([first, first, second]),
+            store.WeekdayStats([2] * 7, [20] * 7, [4] * 7, [24] * 7)
+        )
+        self.assertEqual(
+            rollups.summarize(first),
+            rollups.UserSummary(7, 70, 10.0, 2.0, 12.0)
+        )
+        self.assertEqual(
+            rollups.summarize(second), rollups.UserSummary(0, 0, 0, 0, 0)
+        )
+
+        summaries = rollups.build_rollups(
+            {1: first, 2: second, 3: first}
+        ).users
+        self.assertEqual(
+            rollups.top_users(summaries, 'total', 5), [(1, 70), (3, 70)]
+        )
+        self.assertEqual(
+            rollups.top_users(summaries, 'end', 1, ascending=True),
+            [(1, 12.0)]
+        )
+
+        app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        data = utils.get_data()
+        self.assertEqual(
+            data.rollups,
+            rollups.build_rollups(utils.read_data(TEST_DATA_CSV).weekday_table)
+        )
+        self.assertEqual(data.rollups.company.counts, [1, 2, 2, 3, 1, 0, 0])
+
+
+class PresenceAnalyzerEngineTestCase(unittest.TestCase):
+    """
+    Aggregation engines tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'AGGREGATION_ENGINE': 'python'})
+
+    def test_weekday_stats(self):
+        """
+        Test summing presence entries by weekday.
+        """
+        stats = utils.weekday_stats(utils.get_data()[10])
+        self.assertEqual(stats.counts, [0, 1, 1, 1, 0, 0, 0])
+        self.assertEqual(stats.totals, [0, 30047, 24465, 23705, 0, 0, 0])
+        self.assertEqual(stats.starts, [0, 34745, 33592, 38926, 0, 0, 0])
+        self.assertEqual(stats.ends, [0, 64792, 58057, 62631, 0, 0, 0])
+        self.assertEqual(
+            utils.weekday_means(stats),
+            [0, 30047.0, 24465.0, 23705.0, 0, 0, 0]
+        )
+        self.assertItemsEqual(
+            utils.weekday_avgs(stats),
+            utils.group_user_avgs_weekday(utils.get_data()[10])
+        )
+
+    def test_weekday_table(self):
+        """
+        Test weekday statistics are computed together with data.
+        """
+        data = utils.get_data()
+        self.assertItemsEqual(data.weekday_table.keys(), data.keys())
+        for user_id in data:
+            self.assertEqual(
+                data.weekday_table[user_id],
+                utils.weekday_stats(data[user_id])
+            )
+
+        utils.get_data.invalidate()
+        self.assertIsNot(utils.get_data().weekday_table, data.weekday_table)
+
+    @unittest.skipIf(engine.numpy is None, 'numpy is not installed')
+    def test_numpy_engine(self):
+        """
+        Test NumPy engine gives the same results as pure Python.
+        """
+        data = utils.get_data()
+        main.app.config.update({'AGGREGATION_ENGINE': 'numpy'})
+        self.assertTrue(engine.use_numpy())
+        for user_id in data:
+            self.assertEqual(
+                engine.user_weekday_stats(data[user_id]),
+                utils.weekday_stats(data[user_id])
+            )
+        self.assertEqual(
+            engine.users_weekday_stats(data),
+            {
+                user_id: utils.weekday_stats(items)
+                for user_id, items in data.iteritems()
+            }
+        )
+        self.assertEqual(engine.users_weekday_stats(store.PresenceStore()), {})
+
+    def test_numpy_engine_fallback(self):
+        """
+        Test pure Python is used when numpy is missing.
+        """
+        main.app.config.update({'AGGREGATION_ENGINE': 'numpy'})
+        numpy, engine.numpy = engine.numpy, None
+        try:
+            self.assertFalse(engine.use_numpy())
+            resp = main.app.test_client().get('/api/v1/presence_weekday/10')
+            self.assertEqual(resp.status_code, 200)
+        finally:
+            engine.numpy = numpy
+
+
+class PresenceAnalyzerSnapshotTestCase(unittest.TestCase):
+    """
+    Presence data snapshot tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmp_csv = copy_test_data(self)
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_SNAPSHOT': False,
+        })
+
+    def test_save_load(self):
+        """
+        Test data read from snapshot equals data read from CSV file.
+        """
+        self.assertIsNone(snapshot.load(self.tmp_csv))
+        data = utils.read_data(self.tmp_csv)
+        snapshot.save(data, self.tmp_csv)
+        loaded = snapshot.load(self.tmp_csv)
+        self.assertEqual(loaded, data)
+        self.assertEqual(loaded.weekday_table, data.weekday_table)
+        self.assertEqual(loaded.position, data.position)
+
+    def test_stale_snapshot(self):
+        """
+        Test snapshot is not used when CSV file changes.
+        """
+        snapshot.save(utils.read_data(self.tmp_csv), self.tmp_csv)
+
+        # same content, other mtime
+        os.utime(self.tmp_csv, (0, 0))
+        self.assertIsNotNone(snapshot.load(self.tmp_csv))
+
+        with open(self.tmp_csv, 'a') as csvfile:
+            csvfile.write('12,2013-09-12,10:48:46,17:23:51\n')
+        self.assertIsNone(snapshot.load(self.tmp_csv))
+
+        # same size, other content
+        with open(self.tmp_csv, 'r+') as csvfile:
+            csvfile.write('12')
+        snapshot.save(utils.read_data(self.tmp_csv), self.tmp_csv)
+        with open(self.tmp_csv, 'r+') as csvfile:
+            csvfile.write('13')
+        os.utime(self.tmp_csv, (0, 0))
+        self.assertIsNone(snapshot.load(self.tmp_csv))
+
+    def test_broken_snapshot(self):
+        """
+        Test broken snapshot is ignored.
+        """
+        snapshot.save(utils.read_data(self.tmp_csv), self.tmp_csv)
+        path = snapshot.snapshot_path(self.tmp_csv)
+        with open(path, 'r+') as snapshot_file:
+            snapshot_file.truncate(os.path.getsize(path) - 100)
+        self.assertIsNone(snapshot.load(self.tmp_csv))
+
+        with open(path, 'w') as snapshot_file:
+            snapshot_file.write('broken')
+        self.assertIsNone(snapshot.load(self.tmp_csv))
+
+    def test_get_data_snapshot(self):
+        """
+        Test get_data writes and reads snapshot.
+        """
+        main.app.config.update({'DATA_SNAPSHOT': True})
+        data = utils.get_data()
+        self.assertTrue(
+            os.path.exists(snapshot.snapshot_path(self.tmp_csv))
+        )
+        utils.get_data.invalidate()
+        self.assertEqual(utils.get_data(), data)
+
+
+class PresenceAnalyzerDatabaseTestCase(unittest.TestCase):
+    """
+    SQLite storage tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_db = os.path.join(self.tmp_dir, 'data.sqlite')
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({
+            'DATA_BACKEND': 'csv',
+            'DATA_SQLITE': None,
+        })
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_load(self):
+        """
+        Test data read from database equals data read from CSV file.
+        """
+        data = utils.read_data(TEST_DATA_CSV)
+        database.save(data, self.tmp_db)
+        loaded = database.load(self.tmp_db)
+        self.assertEqual(loaded, data)
+        self.assertEqual(loaded.weekday_table, data.weekday_table)
+        self.assertEqual(loaded.rollups, data.rollups)
+        self.assertEqual(os.listdir(self.tmp_dir), ['data.sqlite'])
+
+    def test_queries(self):
+        """
+        Test entries are queried from database by user and date range.
+        """
+        data = utils.read_data(TEST_DATA_CSV)
+        database.save(data, self.tmp_db)
+        loaded = database.load(self.tmp_db)
+        user = loaded[11]
+        self.assertIsInstance(user, database.DatabaseUser)
+        self.assertEqual(len(user), 6)
+        self.assertIn(datetime.date(2013, 9, 13), user)
+        self.assertNotIn(datetime.date(2013, 9, 14), user)
+        self.assertEqual(
+            user[datetime.date(2013, 9, 13)],
+            data[11][datetime.date(2013, 9, 13)],
+        )
+
+        first = datetime.date(2013, 9, 6).toordinal()
+        last = datetime.date(2013, 9, 10).toordinal()
+        for date_range in ((first, last), (None, last), (first, None)):
+            self.assertEqual(
+                user.between(*date_range), data[11].between(*date_range)
+            )
+            self.assertEqual(
+                user.count_between(*date_range),
+                data[11].count_between(*date_range),
+            )
+            self.assertEqual(
+                user.weekday_stats(*date_range),
+                engine.user_weekday_stats(data[11].between(*date_range)),
+            )
+        self.assertEqual(user.count_between(last + 10), 0)
+
+        # every thread has own connection
+        counts = []
+        thread = threading.Thread(
+            target=lambda: counts.append(user.count_between())
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [6])
+
+    def test_backends_output(self):
+        """
+        Test API responses are the same with CSV and SQLite backends.
+        """
+        client = main.app.test_client()
+        expected = [client.get(url).data for url in BACKEND_URLS]
+
+        database.save(utils.read_data(TEST_DATA_CSV), self.tmp_db)
+        main.app.config.update({
+            'DATA_BACKEND': 'sqlite',
+            'DATA_SQLITE': self.tmp_db,
+        })
+        self.assertEqual(utils.get_data.path(), self.tmp_db)
+        self.assertEqual(
+            [client.get(url).data for url in BACKEND_URLS], expected
+        )
+
+    def test_get_data_reload(self):
+        """
+        Test get_data reads database again when it is replaced.
+        """
+        main.app.config.update({'DATA_BACKEND': 'sqlite'})
+        self.assertEqual(
+            utils.get_data.path(), database.database_path(TEST_DATA_CSV)
+        )
+        main.app.config.update({'DATA_SQLITE': self.tmp_db})
+        database.save(utils.read_data(TEST_DATA_CSV), self.tmp_db)
+        self.assertItemsEqual(utils.get_data().keys(), [10, 11])
+
+        database.save(utils.read_data(TEST_WRONG_DATA_CSV), self.tmp_db)
+        os.utime(self.tmp_db, (0, 0))
+        self.assertEqual(len(utils.get_data()[11]), 5)
+
+
+class PresenceAnalyzerSharedTestCase(unittest.TestCase):
+    """
+    Shared memory-mapped presence data tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmp_csv = copy_test_data(self)
+        utils.get_data.invalidate()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_SHARED': False,
+        })
+        utils.get_data.invalidate()
+
+    def test_publish_attach(self):
+        """
+        Test data attached to published file equals data read from CSV.
+        """
+        self.assertIsNone(shared.attach(self.tmp_csv))
+        data = utils.read_data(self.tmp_csv)
+        shared.publish(data, self.tmp_csv)
+        attached = shared.attach(self.tmp_csv)
+        self.assertIsInstance(attached, shared.SharedStore)
+        self.assertEqual(attached.generation, 1)
+        self.assertEqual(attached, data)
+        self.assertEqual(attached.weekday_table, data.weekday_table)
+        self.assertEqual(attached.rollups, data.rollups)
+        self.assertEqual(attached.position, data.position)
+
+        dates = attached[11].dates
+        self.assertIsInstance(dates, shared.MappedArray)
+        self.assertEqual(len(dates), 6)
+        self.assertEqual(dates[-1], data[11].dates[-1])
+        self.assertEqual(dates[1:4], data[11].dates[1:4])
+        self.assertEqual(list(dates), list(data[11].dates))
+        self.assertEqual(dates.tostring(), data[11].dates.tostring())
+        with self.assertRaises(IndexError):
+            dates[6]  # pylint: disable=pointless-statement
+        first = datetime.date(2013, 9, 6).toordinal()
+        last = datetime.date(2013, 9, 10).toordinal()
+        self.assertEqual(
+            attached[11].between(first, last),
+            data[11].between(first, last),
+        )
+        self.assertEqual(attached[11].copy(), data[11])
+
+        shared.publish(data, self.tmp_csv)
+        self.assertEqual(shared.attach(self.tmp_csv).generation, 2)
+        self.assertEqual(dates[1:4], data[11].dates[1:4])
+
+    def test_load(self):
+        """
+        Test data is built once and published again when CSV changes.
+        """
+        builds = []
+
+        def build(path):
+            """
+            Reads CSV file counting calls.
+            """
+            builds.append(path)
+            return utils.read_data(path)
+
+        self.assertEqual(shared.load(self.tmp_csv, build).generation, 1)
+        self.assertEqual(shared.load(self.tmp_csv, build).generation, 1)
+        self.assertEqual(builds, [self.tmp_csv])
+
+        with open(self.tmp_csv, 'ab') as csvfile:
+            csvfile.write('10,2013-09-13,9:00:00,17:00:00\r\n')
+        self.assertIsNone(shared.attach(self.tmp_csv))
+        data = shared.load(self.tmp_csv, build)
+        self.assertEqual(data.generation, 2)
+        self.assertEqual(len(data[10]), 4)
+        self.assertEqual(len(builds), 2)
+
+    def test_get_data_shared(self):
+        """
+        Test API responses are the same with shared data.
+        """
+        client = main.app.test_client()
+        expected = [client.get(url).data for url in BACKEND_URLS]
+
+        main.app.config.update({'DATA_SHARED': True})
+        utils.get_data.invalidate()
+        self.assertEqual(
+            [client.get(url).data for url in BACKEND_URLS], expected
+        )
+        self.assertIsInstance(utils.get_data(), shared.SharedStore)
+
+        with open(self.tmp_csv, 'ab') as csvfile:
+            csvfile.write('10,2013-09-13,9:00:00,17:00:00\r\n')
+        data = utils.get_data()
+        self.assertEqual(len(data[10]), 4)
+
+        # appended rows are published as the next generation
+        self.assertIsInstance(data, shared.SharedStore)
+        self.assertEqual(data.generation, 2)
+        for items in data.itervalues():
+            self.assertIsInstance(items.dates, shared.MappedArray)
+        self.assertEqual(
+            shared.current_generation(shared.shared_path(self.tmp_csv)), 2
+        )
 
 
 def suite():
@@ -437,6 +1921,11 @@ def suite():
     base_suite = unittest.TestSuite()
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerViewsTestCase))
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerUtilsTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerStoreTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerEngineTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerSnapshotTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerDatabaseTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerSharedTestCase))
     return base_suite
 
 if __name__ == '__main__':
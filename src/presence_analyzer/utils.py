@@ -3,43 +3,441 @@
 Helper functions used in views.
 """
 
+import calendar
+from collections import OrderedDict, namedtuple
 import csv
-from datetime import datetime
-from functools import wraps
-from json import dumps
+from datetime import date, datetime, time as dtime
+from functools import update_wrapper, wraps
+import hashlib
 import logging
+import multiprocessing
+import os
+import threading
 
-from flask import Response
+from flask import Response, abort, g, has_request_context, request
+from lxml import etree
+from werkzeug.http import is_resource_modified, quote_etag
 
+from presence_analyzer import (
+    database,
+    metrics,
+    serializers,
+    shared,
+    snapshot,
+)
+from presence_analyzer.engine import user_weekday_stats, users_weekday_stats
 from presence_analyzer.main import app
+from presence_analyzer.rollups import build_rollups
+from presence_analyzer.store import (
+    CsvPosition,
+    PresenceStore,
+    UserPresence,
+    sum_weekday_entries,
+)
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 DEFAULT_DATETIME = str(datetime(1, 1, 1, 0, 0, 0))
 
+User = namedtuple('User', 'name avatar')
+
+
+class ResponseCache(object):
+    """
+    Bounded LRU cache of serialized responses.
+
+    Limits are read from <config_prefix>_ENTRIES and <config_prefix>_BYTES
+    config options, zero disables the cache.
+    """
+
+    def __init__(self, config_prefix='RESPONSE_CACHE'):
+        self.config_prefix = config_prefix
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns cached body or None.
+        """
+        with self.lock:
+            body = self.entries.pop(key, None)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries[key] = body
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        """
+        Stores body evicting least recently used entries over the limits.
+        """
+        max_entries = app.config[self.config_prefix + '_ENTRIES']
+        max_bytes = app.config[self.config_prefix + '_BYTES']
+        if len(body) > max_bytes or max_entries <= 0:
+            return
+        with self.lock:
+            old_body = self.entries.pop(key, None)
+            if old_body is not None:
+                self.size -= len(old_body)
+            self.entries[key] = body
+            self.size += len(body)
+            while len(self.entries) > max_entries or self.size > max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        """
+        Drops all cached responses.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+response_cache = ResponseCache()  # pylint: disable=invalid-name
+
+
+@metrics.timed('jsonify')
+def serialize(value):
+    """
+    Returns JSON representation of value with configured serializer.
+    """
+    return serializers.dumps(value)
+
 
 def jsonify(function):
     """
     Creates a response with the JSON representation of wrapped function result.
+
+    Inside views wrapped with ``conditional`` serialized responses are kept
+    in ``response_cache`` under endpoint, view arguments and data versions.
+    Lists longer than JSON_CHUNK_ITEMS are streamed in chunks and cached
+    once the whole body is sent.
     """
     @wraps(function)
     def inner(*args, **kwargs):
         """
         This docstring will be overridden by @wraps decorator.
         """
-        return Response(
-            dumps(function(*args, **kwargs)),
-            mimetype='application/json'
+        versions = None
+        if has_request_context():
+            versions = getattr(g, 'data_versions', None)
+        if versions is None:
+            return Response(
+                serialize(function(*args, **kwargs)),
+                mimetype='application/json'
+            )
+
+        key = (
+            request.endpoint,
+            tuple(sorted(request.view_args.items())),
+            request.query_string,
+            versions,
         )
+        body = response_cache.get(key)
+        if body is not None:
+            return Response(body, mimetype='application/json')
+
+        value = function(*args, **kwargs)
+        chunk_items = app.config['JSON_CHUNK_ITEMS']
+        if isinstance(value, list) and len(value) > chunk_items:
+            chunks = serializers.dumps_chunks(value, chunk_items)
+            return Response(
+                cached_chunks(key, chunks), mimetype='application/json'
+            )
+        body = serialize(value)
+        response_cache.put(key, body)
+        return Response(body, mimetype='application/json')
     return inner
 
 
+def cached_chunks(key, chunks):
+    """
+    Yields chunks of response body and caches the whole body at the end.
+    """
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+    response_cache.put(key, ''.join(body))
+
+
+def conditional(*caches, **options):
+    """
+    Answers conditional GET requests before calling wrapped view.
+
+    ETag is derived from versions of files behind given FileCache objects
+    and request path with arguments, Last-Modified is the newest file
+    mtime. Matching If-None-Match or If-Modified-Since gets empty 304
+    response.
+
+    Only existing resources get 304: date range arguments are checked
+    first, and so is the resource with ``validate`` option, a function
+    called with view arguments which aborts when it is not found.
+    """
+    validate = options.get('validate')
+
+    def decorator(function):
+        """
+        Wraps view with conditional request handling.
+        """
+        @wraps(function)
+        def inner(*args, **kwargs):
+            """
+            This docstring will be overridden by @wraps decorator.
+            """
+            versions = []
+            for cache in caches:
+                cache()  # load data the view is going to use
+                versions.append(cache.version)
+            get_date_range()  # aborts with 400 for wrong dates
+            if validate is not None:
+                validate(*args, **kwargs)
+            if None in versions:
+                return function(*args, **kwargs)
+            g.data_versions = tuple(versions)
+
+            etag = hashlib.md5(
+                repr(versions) + request.full_path
+            ).hexdigest()
+            last_modified = datetime.utcfromtimestamp(
+                int(max(version[1] for version in versions))
+            )
+            if is_resource_modified(
+                    request.environ, quote_etag(etag), None, last_modified
+            ):
+                response = function(*args, **kwargs)
+            else:
+                response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+        return inner
+    return decorator
+
+
+def get_date_range():
+    """
+    Reads optional 'from' and 'to' dates from request arguments.
+
+    Returns (first, last) pair of date ordinals, inclusive, with None for
+    open end, or None when no range is given. Aborts with 400 for wrong
+    dates.
+    """
+    dates = request.args.get('from'), request.args.get('to')
+    if dates == (None, None):
+        return None
+    try:
+        return tuple(
+            parse_date(value).toordinal() if value else None
+            for value in dates
+        )
+    except ValueError:
+        log.debug('Wrong date range: %s', dates)
+        abort(400)
+
+
+def get_user_ids(data):
+    """
+    Reads optional 'users' argument: comma separated user ids or 'all'.
+
+    Returns list of user ids, all users of ``data`` by default. Aborts
+    with 400 for wrong ids.
+    """
+    user_ids = request.args.get('users', 'all')
+    if user_ids == 'all':
+        return data.keys()
+    try:
+        return [int(i) for i in user_ids.split(',') if i]
+    except ValueError:
+        log.debug('Wrong users argument: %s', user_ids)
+        abort(400)
+
+
+@metrics.timed('select_stats')
+def select_stats(data, user_id, date_range):
+    """
+    Returns WeekdayStats of user, limited to the range from get_date_range.
+    """
+    if date_range is None:
+        return data.weekday_table[user_id]
+    if isinstance(data, database.DatabaseStore):
+        return data[user_id].weekday_stats(*date_range)
+    return user_weekday_stats(data[user_id].between(*date_range))
+
+
+def file_key(path):
+    """
+    Returns a (path, mtime, size) tuple identifying given file version.
+    """
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size)
+
+
+class FileCache(object):
+    """
+    Keeps result of wrapped function until its source file changes.
+
+    Source file path is read from application config under ``config_key``,
+    or returned by it when it is a function, and its version is identified
+    by ``file_key``. Only one thread rebuilds the value, other threads get
+    the previous value of the same file or, when there is none, wait
+    for the rebuild to finish.
+
+    Function registered with ``updater`` gets the previous value when the
+    same file changes and may return updated value instead of a full
+    rebuild, or None to force it. Callbacks registered with ``on_reload``
+    are called whenever cached value is replaced or dropped.
+
+    In ``background`` mode source file is not checked on calls, the value
+    is rebuilt only by ``refresh`` called from a background thread.
+    """
+
+    def __init__(self, function, config_key):
+        self.function = function
+        self.config_key = config_key
+        self.update = None
+        self.callbacks = []
+        self.cached = None  # (file key, value) tuple
+        self.background = False
+        self.lock = threading.Lock()
+        update_wrapper(self, function)
+
+    def __call__(self):
+        path = self.path()
+        cached = self.cached
+        if (self.background and cached is not None and
+                cached[0][0] == path):
+            return cached[1]
+        return self.load(file_key(path))
+
+    def path(self):
+        """
+        Returns path of the source file.
+        """
+        if callable(self.config_key):
+            return self.config_key()
+        return app.config[self.config_key]
+
+    def load(self, key):
+        """
+        Returns value for given file key, rebuilding it when needed.
+        """
+        cached = self.cached
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        if cached is not None and cached[0][0] == key[0]:
+            if not self.lock.acquire(False):
+                # other thread is already rebuilding this file
+                return cached[1]
+        else:
+            self.lock.acquire()
+        try:
+            cached = self.cached
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            value = None
+            if (self.update is not None and cached is not None and
+                    cached[0][0] == key[0]):
+                value = self.update(cached[1])
+            if value is None:
+                value = self.function()
+            self.cached = (key, value)
+            self.reloaded()
+            return value
+        finally:
+            self.lock.release()
+
+    def refresh(self):
+        """
+        Rebuilds value if source file changed.
+
+        When rebuild fails the error is logged and previous value is kept.
+        Returns True when value was replaced.
+        """
+        version = self.version
+        path = self.path()
+        try:
+            self.load(file_key(path))
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Cannot reload %s', path)
+            return False
+        return self.version != version
+
+    def on_reload(self, callback):
+        """
+        Registers callback called when cached value changes.
+        """
+        self.callbacks.append(callback)
+        return callback
+
+    def reloaded(self):
+        """
+        Calls reload callbacks.
+        """
+        for callback in self.callbacks:
+            callback()
+
+    def updater(self, function):
+        """
+        Registers function updating previous value, usable as decorator.
+        """
+        self.update = function
+        return function
+
+    @property
+    def version(self):
+        """
+        Key of the cached file version or None when nothing is cached.
+        """
+        cached = self.cached
+        return cached[0] if cached is not None else None
+
+    def invalidate(self):
+        """
+        Drops cached value, next call rebuilds it.
+        """
+        self.cached = None
+        self.reloaded()
+
+
+def cache_by_file(config_key):
+    """
+    Caches wrapped function result until file from ``config_key`` changes.
+    """
+    def decorator(function):
+        """
+        Wraps function with FileCache.
+        """
+        return FileCache(function, config_key)
+    return decorator
+
+
+def data_path():
+    """
+    Returns path of presence data file read by configured DATA_BACKEND.
+    """
+    if app.config['DATA_BACKEND'] == 'sqlite':
+        return app.config['DATA_SQLITE'] or database.database_path(
+            app.config['DATA_CSV']
+        )
+    return app.config['DATA_CSV']
+
+
+@cache_by_file(data_path)
+@metrics.timed('get_data')
 def get_data():
     u"""
     Extracts presence data from CSV file and groups it by user_id.
 
-    It creates structure like this:
+    It creates PresenceStore, a dict of user_id to UserPresence objects,
+    which can be read like this structure:
     data = {
         'user_id': {
             datetime.date(2015, 1, 1): {
@@ -48,44 +446,413 @@ def get_data():
             },
         }
     }
+
+    Weekday statistics of every user are computed once per load and kept
+    in ``data.weekday_table``.
+
+    With DATA_SNAPSHOT config option enabled, parsed data is also saved to
+    a binary snapshot next to DATA_CSV and read from there when it is
+    still valid. With DATA_SHARED enabled, parsed data is published to
+    a file mapped by all processes, see shared module. With DATA_BACKEND
+    set to 'sqlite' data is read from DATA_SQLITE database instead, see
+    database module.
+
+    Result is cached until the data file changes, use
+    ``get_data.invalidate()`` to force reload.
+    """
+    if app.config['DATA_BACKEND'] == 'sqlite':
+        return database.load(data_path())
+
+    path = app.config['DATA_CSV']
+    if app.config['DATA_SHARED']:
+        return shared.load(path, read_source)
+    return read_source(path)
+
+
+def read_source(path):
+    """
+    Reads presence CSV file, through the snapshot when it is enabled.
+    """
+    if app.config['DATA_SNAPSHOT']:
+        data = snapshot.load(path)
+        if data is not None:
+            return data
+
+    data = read_data(path)
+    if app.config['DATA_SNAPSHOT']:
+        try:
+            snapshot.save(data, path)
+        except (IOError, OSError):
+            log.exception('Cannot save presence data snapshot')
+    return data
+
+
+def read_data(path, workers=None):
+    """
+    Reads presence CSV file into PresenceStore.
+
+    With more than one worker, DATA_WORKERS config option by default, the
+    file is split into newline-aligned chunks parsed in a process pool.
+    """
+    if workers is None:
+        workers = app.config['DATA_WORKERS']
+    with open(path, 'rb') as csvfile:
+        stat = os.fstat(csvfile.fileno())
+        if workers > 1:
+            offset = stat.st_size
+            data, rows = read_chunks(
+                path, split_file(csvfile, offset, workers), workers
+            )
+        else:
+            data = PresenceStore()
+            rows = read_presence(data, csvfile)
+            offset = csvfile.tell()
+        data.position = CsvPosition(
+            stat.st_ino,
+            offset,
+            rows,
+            read_last_line(csvfile, offset),
+        )
+    data.weekday_table = users_weekday_stats(data)
+    data.rollups = build_rollups(data.weekday_table)
+    return data
+
+
+def split_file(csvfile, size, parts):
+    """
+    Returns (start, stop) byte ranges of file chunks ending at line ends.
+    """
+    bounds = [0]
+    for part in xrange(1, parts):
+        csvfile.seek(max(size * part // parts, bounds[-1]))
+        csvfile.readline()
+        bounds.append(min(csvfile.tell(), size))
+    bounds.append(size)
+    return zip(bounds, bounds[1:])
+
+
+def read_chunk(chunk):
+    """
+    Parses (path, start, stop) chunk of presence CSV file in pool worker.
+
+    Returns number of rows and {user_id: UserPresence.to_strings()}. Line
+    numbers in logs are counted from chunk start.
+    """
+    path, start, stop = chunk
+    with open(path, 'rb') as csvfile:
+        csvfile.seek(start)
+        lines = csvfile.read(stop - start).splitlines(True)
+    data = PresenceStore()
+    rows = read_presence(data, lines)
+    return rows, {
+        user_id: items.to_strings()
+        for user_id, items in data.iteritems()
+    }
+
+
+def read_chunks(path, chunks, workers):
+    """
+    Parses file chunks in a process pool and merges them in file order.
+
+    Later rows win on duplicate dates, just like in serial read. Returns
+    PresenceStore and number of rows.
+    """
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(
+            read_chunk, [(path, start, stop) for start, stop in chunks]
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+    data = PresenceStore()
+    rows = 0
+    for chunk_rows, users in results:
+        rows += chunk_rows
+        for user_id, strings in users.iteritems():
+            items = UserPresence.from_strings(*strings)
+            if user_id in data:
+                data[user_id].extend(items)
+            else:
+                data[user_id] = items
+    return data, rows
+
+
+@get_data.updater
+@metrics.timed('update_data')
+def update_data(data):
     """
-    data = {}
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
-        presence_reader = csv.reader(csvfile, delimiter=',')
-        for i, row in enumerate(presence_reader):
-            if len(row) != 4:
-                # ignore header and footer lines
-                continue
-
-            try:
-                user_id = int(row[0])
-                date = datetime.strptime(row[1], '%Y-%m-%d').date()
-                start = datetime.strptime(row[2], '%H:%M:%S').time()
-                end = datetime.strptime(row[3], '%H:%M:%S').time()
-            except (ValueError, TypeError):
-                log.debug('Problem with line %d: ', i, exc_info=True)
-
-            data.setdefault(user_id, {})[date] = {'start': start, 'end': end}
+    Adds lines appended to DATA_CSV since ``data`` was read.
+
+    Only complete lines are read, the rest waits for the next update.
+    ``data`` is left untouched, a new PresenceStore is returned. Returns
+    None when the file was truncated, replaced or rewritten and has to be
+    read again.
+
+    Shared data is never updated in one process, it would turn into its
+    private copy. None is returned, so the file is read once and published
+    as the next generation, which other processes attach to.
+    """
+    position = data.position
+    if (position is None or isinstance(data, shared.SharedStore) or
+            not position.last_line.endswith('\n')):
+        return None
+
+    with open(app.config['DATA_CSV'], 'rb') as csvfile:
+        stat = os.fstat(csvfile.fileno())
+        if stat.st_ino != position.inode or stat.st_size < position.offset:
+            return None
+        csvfile.seek(position.offset - len(position.last_line))
+        if csvfile.read(len(position.last_line)) != position.last_line:
+            return None
+        tail = csvfile.read()
+
+    tail = tail[:tail.rfind('\n') + 1]
+    if not tail:
+        return data
+    lines = tail.splitlines(True)
+    appended = PresenceStore()
+    rows = read_presence(appended, lines, position.rows)
+    log.debug('Read %d rows appended to presence data', rows)
+
+    data = data.merged(appended)
+    data.weekday_table.update(users_weekday_stats(
+        {user_id: data[user_id] for user_id in appended}
+    ))
+    data.rollups = build_rollups(data.weekday_table)
+    data.position = CsvPosition(
+        position.inode,
+        position.offset + len(tail),
+        position.rows + rows,
+        lines[-1],
+    )
     return data
 
 
+def read_presence(data, lines, first_row=0):
+    """
+    Parses presence CSV lines into PresenceStore.
+
+    Returns number of rows read.
+    """
+    # the same dates and times repeat in many rows, parse each once
+    ordinals = {}
+    seconds = {}
+    presence_reader = csv.reader(lines, delimiter=',')
+    i = first_row - 1
+    for i, row in enumerate(presence_reader, first_row):
+        if len(row) != 4:
+            # ignore header and footer lines
+            continue
+
+        try:
+            user_id = int(row[0])
+            day = ordinals.get(row[1])
+            if day is None:
+                day = ordinals[row[1]] = parse_date(row[1]).toordinal()
+            start = seconds.get(row[2])
+            if start is None:
+                start = seconds[row[2]] = parse_seconds(row[2])
+            end = seconds.get(row[3])
+            if end is None:
+                end = seconds[row[3]] = parse_seconds(row[3])
+        except (ValueError, TypeError):
+            log.debug('Problem with line %d: ', i, exc_info=True)
+            continue
+
+        data.add(user_id, day, start, end)
+    return i + 1 - first_row
+
+
+def read_last_line(csvfile, offset):
+    """
+    Returns last line of the file ending at ``offset``.
+    """
+    start = max(0, offset - 4096)
+    csvfile.seek(start)
+    chunk = csvfile.read(offset - start)
+    return chunk[chunk.rfind('\n', 0, len(chunk) - 1) + 1:]
+
+
+@cache_by_file('USERS_XML')
+@metrics.timed('get_users')
+def get_users():
+    u"""
+    Extracts users from intranet XML file.
+
+    It creates structure like this:
+    users = {
+        141: User(name='Adam P.', avatar='/api/images/users/141'),
+    }
+
+    Result is cached until USERS_XML file changes, use
+    ``get_users.invalidate()`` to force reload.
+    """
+    users = {}
+    for _, element in etree.iterparse(  # pylint: disable=no-member
+            app.config['USERS_XML'], tag='user'
+    ):
+        users[int(element.get('id'))] = User(
+            element.findtext('name'), element.findtext('avatar')
+        )
+        element.clear()
+    return users
+
+
+get_data.on_reload(response_cache.clear)
+get_users.on_reload(response_cache.clear)
+metrics.register(
+    'response_cache_hits_total', 'counter', 'Responses served from cache.',
+    lambda: response_cache.hits,
+)
+metrics.register(
+    'response_cache_misses_total', 'counter', 'Responses not found in cache.',
+    lambda: response_cache.misses,
+)
+metrics.register(
+    'response_cache_entries', 'gauge', 'Responses kept in cache.',
+    lambda: len(response_cache.entries),
+)
+metrics.register(
+    'response_cache_bytes', 'gauge', 'Size of responses kept in cache.',
+    lambda: response_cache.size,
+)
+
+
+def parse_date(value):
+    """
+    Parses 'YYYY-MM-DD' string into datetime.date.
+
+    Fixed-width values are sliced and converted with a single int() call,
+    anything else goes through datetime.strptime.
+    """
+    if len(value) == 10 and value[4] == value[7] == '-':
+        digits = value[:4] + value[5:7] + value[8:]
+        if digits.isdigit():
+            number = int(digits)
+            return date(number // 10000, number // 100 % 100, number % 100)
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_time(value):
+    """
+    Parses 'HH:MM:SS' string into datetime.time.
+
+    Fixed-width values are sliced and converted with a single int() call,
+    anything else goes through datetime.strptime.
+    """
+    if len(value) == 8 and value[2] == value[5] == ':':
+        digits = value[:2] + value[3:5] + value[6:]
+        if digits.isdigit():
+            number = int(digits)
+            return dtime(number // 10000, number // 100 % 100, number % 100)
+    return datetime.strptime(value, '%H:%M:%S').time()
+
+
+def parse_seconds(value):
+    """
+    Parses 'HH:MM:SS' string into number of seconds since midnight.
+    """
+    if len(value) == 8 and value[2] == value[5] == ':':
+        digits = value[:2] + value[3:5] + value[6:]
+        if digits.isdigit():
+            number = int(digits)
+            hours, minutes, seconds = (
+                number // 10000, number // 100 % 100, number % 100
+            )
+            if hours < 24 and minutes < 60 and seconds < 60:
+                return hours * 3600 + minutes * 60 + seconds
+    return seconds_since_midnight(parse_time(value))
+
+
+def weekday_entries(items):
+    """
+    Yields (weekday, start, end) tuples for presence entries of one user.
+
+    Start and end are given as seconds since midnight. Works with
+    UserPresence objects and plain {date: {'start':, 'end':}} mappings.
+    """
+    if hasattr(items, 'weekday_entries'):
+        return items.weekday_entries()
+    return (
+        (
+            day.weekday(),
+            seconds_since_midnight(items[day]['start']),
+            seconds_since_midnight(items[day]['end']),
+        )
+        for day in items
+    )
+
+
+@metrics.timed('group_by_weekday')
 def group_by_weekday(items):
     """
     Groups presence entries by weekday.
     """
     result = [[], [], [], [], [], [], []]  # one list for every day in week
-    for date in items:
-        start = items[date]['start']
-        end = items[date]['end']
-        result[date.weekday()].append(interval(start, end))
+    for weekday, start, end in weekday_entries(items):
+        result[weekday].append(end - start)
     return result
 
 
+def weekday_stats(items):
+    """
+    Sums presence entries of one user by weekday.
+
+    Returns WeekdayStats.
+    """
+    return sum_weekday_entries(weekday_entries(items))
+
+
+def weekday_means(stats):
+    """
+    Calculates mean presence for every weekday from WeekdayStats.
+
+    Returns zero for weekdays without entries, just like mean().
+    """
+    return [
+        float(total) / count if count > 0 else 0
+        for count, total in zip(stats.counts, stats.totals)
+    ]
+
+
+def weekday_mean_times(stats):
+    """
+    Returns (weekday name, mean presence) pairs from WeekdayStats.
+    """
+    return [
+        (calendar.day_abbr[wday], value)
+        for wday, value in enumerate(weekday_means(stats))
+    ]
+
+
+def weekday_presence(stats):
+    """
+    Returns table of weekday name and total presence from WeekdayStats.
+    """
+    result = [
+        (calendar.day_abbr[wday], total)
+        for wday, total in enumerate(stats.totals)
+    ]
+    result.insert(0, ('Weekday', 'Presence (s)'))
+    return result
+
+
+@metrics.timed('group_user_avgs_weekday')
 def group_user_avgs_weekday(items):
     """
     Get items collection.
     Return averages for every week days.
     """
+    return weekday_avgs(weekday_stats(items))
+
+
+def weekday_avgs(stats):
+    """
+    Get WeekdayStats of one user.
+    Return average start and end for every week day.
+    """
     def create_datetime(time):
         """
         Create datetime object for specified time.
@@ -101,15 +868,14 @@ def group_user_avgs_weekday(items):
         """
         Build days dictionary with start/end statistics.
         """
-        days = {day: {'starts': 0, 'ends': 0, 'count': 0} for day in DAYS}
-        for date in items:
-            start = items[date]['start']
-            end = items[date]['end']
-            weekday = date.weekday()
-            days[DAYS[weekday]]['starts'] += seconds_since_midnight(start)
-            days[DAYS[weekday]]['ends'] += seconds_since_midnight(end)
-            days[DAYS[weekday]]['count'] += 1
-        return days
+        return {
+            day: {
+                'starts': stats.starts[weekday],
+                'ends': stats.ends[weekday],
+                'count': stats.counts[weekday],
+            }
+            for weekday, day in enumerate(DAYS)
+        }
 
     def build_result(days):
         """
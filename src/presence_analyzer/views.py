@@ -3,25 +3,50 @@
 Defines views.
 """
 
-import calendar
 import logging
 
-from lxml import etree
-from flask import abort
+from flask import Response, abort, request
 import flask_mako as fmako  # pylint: disable=unused-import
 
-from presence_analyzer.config import BASE_XML_FILE
+from presence_analyzer import metrics, serializers
 from presence_analyzer.main import app
+from presence_analyzer.rollups import (
+    RANKINGS,
+    merge_weekday_stats,
+    summarize,
+    top_users,
+)
 from presence_analyzer.utils import (
+    conditional,
     get_data,
-    group_by_weekday,
-    group_user_avgs_weekday,
+    get_date_range,
+    get_user_ids,
+    get_users,
     jsonify,
-    mean,
+    select_stats,
+    weekday_avgs,
+    weekday_mean_times,
+    weekday_presence,
 )
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# metrics available in bulk view, each is computed from WeekdayStats
+METRICS = {
+    'mean_time_weekday': weekday_mean_times,
+    'presence_weekday': weekday_presence,
+    'presence_start_end': weekday_avgs,
+}
+
+
+def require_user(user_id):
+    """
+    Aborts with 404 when user is not found in presence data.
+    """
+    if user_id not in get_data():
+        log.debug('User %s not found!', user_id)
+        abort(404)
+
 
 @app.route('/')
 def weekday():
@@ -48,83 +73,195 @@ def startend():
 
 
 @app.route('/api/v1/users', methods=['GET'])
+@conditional(get_data, get_users)
 @jsonify
 def users_view():
     """
     Users listing for dropdown.
-    """
-    root = {}
-    with open(BASE_XML_FILE, 'r') as xmlfile:
-        root = etree.fromstring(xmlfile.read())  # pylint: disable=no-member
-
-    def get_username(i):
-        """
-        Get user ID
-
-        Return user name from XML file or default string.
-        """
-        user = root[1].xpath("user[@id='{}']".format(i))
-        if user:
-            return user[0][1].text
-        return "User {}".format(i)
 
+    With date range given only users present in that range are listed.
+    """
+    users = get_users()
     data = get_data()
+    date_range = get_date_range()
     return [
-        {'user_id': i, 'name': get_username(i)}
+        {
+            'user_id': i,
+            'name': users[i].name if i in users else 'User {}'.format(i),
+        }
         for i in data.keys()
+        if date_range is None or data[i].count_between(*date_range)
     ]
 
 
 @app.route('/api/v1/mean_time_weekday/<int:user_id>', methods=['GET'])
+@conditional(get_data, validate=require_user)
 @jsonify
 def mean_time_weekday_view(user_id):
     """
     Returns mean presence time of given user grouped by weekday.
     """
     data = get_data()
-    if user_id not in data:
-        log.debug('User %s not found!', user_id)
-        abort(404)
+    date_range = get_date_range()
 
-    weekdays = group_by_weekday(data[user_id])
-    result = [
-        (calendar.day_abbr[wday], mean(intervals))
-        for wday, intervals in enumerate(weekdays)
-    ]
-
-    return result
+    return weekday_mean_times(select_stats(data, user_id, date_range))
 
 
 @app.route('/api/v1/presence_weekday/<int:user_id>', methods=['GET'])
+@conditional(get_data, validate=require_user)
 @jsonify
 def presence_weekday_view(user_id):
     """
     Returns total presence time of given user grouped by weekday.
     """
     data = get_data()
-    if user_id not in data:
-        log.debug('User %s not found!', user_id)
-        abort(404)
-
-    weekdays = group_by_weekday(data[user_id])
-    result = [
-        (calendar.day_abbr[wday], sum(intervals))
-        for wday, intervals in enumerate(weekdays)
-    ]
+    date_range = get_date_range()
 
-    result.insert(0, ('Weekday', 'Presence (s)'))
-    return result
+    return weekday_presence(select_stats(data, user_id, date_range))
 
 
 @app.route('/api/v1/presence_start_end/<int:user_id>', methods=['GET'])
+@conditional(get_data, validate=require_user)
 @jsonify
 def start_end_presence_view(user_id):
     """
     Returns average presence time.
     """
     data = get_data()
-    if user_id not in data:
-        log.debug('User %s not found!', user_id)
-        abort(404)
-    result = group_user_avgs_weekday(data[user_id])
+    date_range = get_date_range()
+    result = weekday_avgs(select_stats(data, user_id, date_range))
     return result
+
+
+@app.route('/api/v1/bulk', methods=['GET'])
+@conditional(get_data)
+def bulk_view():
+    """
+    Returns weekday metrics of many users at once.
+
+    Query arguments:
+     - users: comma separated user ids or 'all' (default),
+     - metrics: comma separated names from METRICS, all by default,
+     - from, to: optional date range, like in other views.
+
+    Unknown users are skipped. Result is streamed as a JSON list of
+    objects with user_id and requested metrics.
+    """
+    data = get_data()
+    user_ids = get_user_ids(data)
+
+    names = request.args.get('metrics')
+    names = names.split(',') if names else sorted(METRICS)
+    if not set(names).issubset(METRICS):
+        log.debug('Wrong metrics argument: %s', names)
+        abort(400)
+
+    date_range = get_date_range()
+
+    def generate():
+        """
+        Yields JSON list chunk by chunk, one user per chunk.
+        """
+        separator = '['
+        for user_id in user_ids:
+            if user_id not in data:
+                continue
+            stats = select_stats(data, user_id, date_range)
+            result = {name: METRICS[name](stats) for name in names}
+            result['user_id'] = user_id
+            yield separator + serializers.dumps(result)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+    return Response(generate(), mimetype='application/json')
+
+
+@app.route('/api/v1/rollup/<metric>', methods=['GET'])
+@conditional(get_data)
+@jsonify
+def rollup_view(metric):
+    """
+    Returns weekday metric of all users taken together.
+
+    Metric is one of METRICS names. Query arguments:
+     - users: comma separated user ids to limit it to a group,
+     - from, to: optional date range, like in other views.
+    """
+    if metric not in METRICS:
+        log.debug('Metric %s not found!', metric)
+        abort(404)
+    data = get_data()
+    date_range = get_date_range()
+    if 'users' not in request.args and date_range is None:
+        stats = data.rollups.company
+    else:
+        stats = merge_weekday_stats(
+            select_stats(data, user_id, date_range)
+            for user_id in get_user_ids(data)
+            if user_id in data
+        )
+    return METRICS[metric](stats)
+
+
+@app.route('/api/v1/top/<key>', methods=['GET'])
+@conditional(get_data, get_users)
+@jsonify
+def top_view(key):
+    """
+    Returns users with the highest values of given key.
+
+    Key is one of: days, total (presence), presence, start and end (daily
+    means), all in seconds. Query arguments:
+     - n: number of users, 10 by default,
+     - order: 'desc' (default) or 'asc' for the lowest values,
+     - from, to: optional date range, like in other views.
+    """
+    if key not in RANKINGS:
+        log.debug('Ranking %s not found!', key)
+        abort(404)
+    try:
+        number = int(request.args.get('n', 10))
+    except ValueError:
+        number = 0
+    order = request.args.get('order', 'desc')
+    if number < 1 or order not in ('asc', 'desc'):
+        log.debug('Wrong ranking arguments: %s', request.args)
+        abort(400)
+
+    data = get_data()
+    date_range = get_date_range()
+    if date_range is None:
+        summaries = data.rollups.users
+    else:
+        summaries = {
+            user_id: summarize(select_stats(data, user_id, date_range))
+            for user_id in data
+        }
+    users = get_users()
+    return [
+        {
+            'user_id': user_id,
+            'name': users[user_id].name if user_id in users else (
+                'User {}'.format(user_id)
+            ),
+            'value': value,
+        }
+        for user_id, value in top_users(
+            summaries, key, number, ascending=order == 'asc'
+        )
+    ]
+
+
+@app.route('/api/v1/_metrics', methods=['GET'])
+def metrics_view():
+    """
+    Returns timing histograms and cache counters in Prometheus text format.
+
+    Available only with METRICS config option enabled.
+    """
+    if not app.config['METRICS']:
+        abort(404)
+    return Response(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )